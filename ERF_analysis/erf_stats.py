@@ -0,0 +1,149 @@
+"""
+Streaming ERF statistics.
+
+The trials are read one bin at a time and the channel averaged time courses are
+accumulated per (session, bin, class, time) using Welford updates. Only the counts,
+means and sums of squared deviations (M2) are kept, so the statistics used for
+plotting and for the std_*.npy files never need the whole dataset in memory.
+
+Usage: python erf_stats.py [--sens]
+"""
+
+import argparse
+import numpy as np
+import sys
+sys.path.append('../decoding')
+from decoding import iter_bins
+
+n_sessions = 7
+n_bins = 7
+
+# channel groups the statistics are computed for (the grad/mag split follows plot_std)
+groups_source = {'all': slice(None)}
+groups_sens = {'all': slice(None), 'grad': slice(None, 204), 'mag': slice(204, None)}
+
+
+def merge_stats(count, mean, m2, axis):
+    """Combines running statistics along one or more axes (Chan et al., 1979).
+
+    Parameters
+    ----------
+    count : array of shape (..., ) with the number of trials
+    mean : array of shape (..., T) with the running means
+    m2 : array of shape (..., T) with the sum of squared deviations from the mean
+    axis : int or tuple of axes of count to merge over
+
+    Returns
+    -------
+    count, mean, m2 with the axes merged. Means and M2 are nan where the count is 0.
+    """
+    if isinstance(axis, int):
+        axis = (axis, )
+    axis = tuple(a % count.ndim for a in axis)
+
+    n = count[..., None].astype(float)
+    n_total = np.sum(n, axis = axis, keepdims = True)
+
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        mean_total = np.nansum(n * mean, axis = axis, keepdims = True) / n_total
+        m2_total = np.nansum(m2 + n * (mean - mean_total)**2, axis = axis, keepdims = True)
+
+    m2_total = np.where(n_total == 0, np.nan, m2_total)
+
+    return np.squeeze(n_total[..., 0], axis = axis).astype(int), np.squeeze(mean_total, axis = axis), np.squeeze(m2_total, axis = axis)
+
+
+class ERFStats():
+    def __init__(self, n_times, groups, n_sessions = n_sessions, n_bins = n_bins, classes = (0, 1)):
+        self.groups = list(groups.keys())
+        self.picks = list(groups.values())
+        self.classes = np.array(classes)
+
+        shape = (n_sessions, n_bins, len(classes))
+        self.count = np.zeros(shape, dtype = int)
+        self.mean = np.zeros((len(self.groups), ) + shape + (n_times, ))
+        self.m2 = np.zeros((len(self.groups), ) + shape + (n_times, ))
+
+    def update(self, X, session, b, k):
+        """Welford update of one (session, bin, class) cell with a batch of trials.
+
+        Parameters
+        ----------
+        X : array of shape (T, n, C) with the new trials
+        session, b, k : index of the session, bin and class
+        """
+        n_new = X.shape[1]
+        if n_new == 0:
+            return
+        n_old = self.count[session, b, k]
+        n = n_old + n_new
+
+        for g, pick in enumerate(self.picks):
+            # average across labels/channels before accumulating over trials
+            x = np.mean(X[:, :, pick], axis = 2)
+            batch_mean = np.mean(x, axis = 1)
+            batch_m2 = np.sum((x - batch_mean[:, None])**2, axis = 1)
+
+            delta = batch_mean - self.mean[g, session, b, k]
+            self.mean[g, session, b, k] += delta * n_new / n
+            self.m2[g, session, b, k] += batch_m2 + delta**2 * n_old * n_new / n
+
+        self.count[session, b, k] = n
+
+    def update_bin(self, X, y, sessioninds, b, chunk_size = 200):
+        """Streams the trials of one bin through the accumulators in chunks."""
+        for session in np.unique(sessioninds):
+            for k, c in enumerate(self.classes):
+                inds = np.where((sessioninds == session) & (y == c))[0]
+                for start in range(0, len(inds), chunk_size):
+                    self.update(X[:, inds[start:start+chunk_size], :], session, b, k)
+
+    def get(self, group = 'all', axis = None):
+        """Returns count, mean and M2 for a channel group, optionally merged over axes of (session, bin, class)."""
+        g = self.groups.index(group)
+        count, mean, m2 = self.count, self.mean[g], self.m2[g]
+        if axis is not None:
+            count, mean, m2 = merge_stats(count, mean, m2, axis)
+        return count, mean, m2
+
+    def std(self, group = 'all', axis = (1, 2)):
+        """Standard deviation across trials (ddof = 0, as np.std).
+
+        The default merges bins and classes, giving the std per session. Use axis = (0, 2) for the std per bin.
+        """
+        count, mean, m2 = self.get(group, axis)
+        return np.sqrt(m2 / count[..., None])
+
+    def save(self, path):
+        np.savez(path, count = self.count, mean = self.mean, m2 = self.m2, groups = np.array(self.groups), classes = self.classes)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        groups = {g: None for g in data['groups']}
+        stats = cls(data['mean'].shape[-1], groups, n_sessions = data['count'].shape[0], n_bins = data['count'].shape[1], classes = data['classes'])
+        stats.count = data['count']
+        stats.mean = data['mean']
+        stats.m2 = data['m2']
+        return stats
+
+
+def compute_erf_stats(sens = False, chunk_size = 200):
+    """Single pass over the trials of one space, one bin in memory at a time."""
+    stats = None
+    for b, X, y, sessioninds in iter_bins(sens = sens):
+        if stats is None:
+            stats = ERFStats(X.shape[0], groups_sens if sens else groups_source)
+        stats.update_bin(X, y, sessioninds, b, chunk_size = chunk_size)
+        del X
+
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sens', action='store_true', help='Compute the statistics in sensor space')
+    args = parser.parse_args()
+
+    stats = compute_erf_stats(sens = args.sens)
+    stats.save('erf_stats_sens.npz' if args.sens else 'erf_stats.npz')
@@ -0,0 +1,83 @@
+"""
+Versioned store of ERF summaries used by the ERF plots and the variance vs. accuracy analysis.
+
+For both spaces (and the grad/mag subsets in sensor space) the store holds per session and
+per bin class means, standard deviations, SEMs and trial counts of the channel averaged
+time courses, as well as the standard deviation pooled across classes (the std_*.npy arrays).
+Keys are named '{space}_{group}_{level}_{stat}', e.g. 'sens_grad_session_sem'.
+
+Usage: python erf_summary.py
+"""
+
+import numpy as np
+from erf_stats import ERFStats, compute_erf_stats
+
+summary_version = 1
+summary_path = 'erf_summary.npz'
+levels = {'session': 1, 'bin': 0} # axis of (session, bin, class) merged away for each level
+
+
+def summarise_stats(stats, space):
+    """Derives means, stds, SEMs and counts per session and per bin from streamed ERF statistics."""
+    summary = {}
+    for group in stats.groups:
+        for level, axis in levels.items():
+            # per class
+            count, mean, m2 = stats.get(group, axis = axis)
+            std = np.sqrt(m2 / count[..., None])
+            summary[f'{space}_{group}_{level}_mean'] = mean
+            summary[f'{space}_{group}_{level}_std'] = std
+            summary[f'{space}_{group}_{level}_sem'] = std / np.sqrt(count[..., None])
+            summary[f'{space}_{group}_{level}_count'] = count
+
+            # pooled across classes
+            count, mean, m2 = stats.get(group, axis = (axis, 2))
+            summary[f'{space}_{group}_{level}_std_pooled'] = np.sqrt(m2 / count[..., None])
+            summary[f'{space}_{group}_{level}_count_pooled'] = count
+
+    summary[f'{space}_groups'] = np.array(stats.groups)
+    summary[f'{space}_classes'] = stats.classes
+
+    return summary
+
+
+def build_summary(path = summary_path):
+    """Builds the store from the streamed statistics of both spaces, computing them if needed."""
+    summary = {'version': np.array(summary_version)}
+    for space, sens in [('source', False), ('sens', True)]:
+        stats_path = 'erf_stats_sens.npz' if sens else 'erf_stats.npz'
+        try:
+            stats = ERFStats.load(stats_path)
+        except FileNotFoundError:
+            stats = compute_erf_stats(sens = sens)
+            stats.save(stats_path)
+        summary.update(summarise_stats(stats, space))
+
+    np.savez(path, **summary)
+
+    return load_summary(path)
+
+
+def load_summary(path = summary_path, rebuild = False):
+    """Loads the summary store, (re)building it if it is missing, outdated or rebuild is True."""
+    if rebuild:
+        return build_summary(path)
+    try:
+        summary = np.load(path)
+    except FileNotFoundError:
+        return build_summary(path)
+
+    if 'version' not in summary.files or int(summary['version']) != summary_version:
+        print(f'{path} was written by another version of the ERF summary store, rebuilding')
+        return build_summary(path)
+
+    return summary
+
+
+def get(summary, stat, space = 'source', group = 'all', level = 'session'):
+    """Returns one array of the store, e.g. get(summary, 'std_pooled', 'sens', 'grad')."""
+    return summary[f'{space}_{group}_{level}_{stat}']
+
+
+if __name__ == '__main__':
+    build_summary()
@@ -0,0 +1,162 @@
+"""
+Benchmark suite of the decoders on synthetic data (see synthetic.py).
+
+Times Decoder.run_decoding, run_decoding_across_sessions, train_test_decoding and the cross decoding
+grid of all pairs of sessions for every dataset size, dtype and (for the grid) executor backend, and
+records the throughput in fitted models per second and TGM cells per second together with the peak
+memory, taken from a second run so that tracing the allocations does not slow down the timed one.
+Each run is appended to a JSON history and compared with the previous run.
+
+Usage: python bench_decoding.py [--quick] [--history HISTORY] [--no-save]
+"""
+
+import os
+import sys
+sys.path.append('../decoding')
+import json
+import time
+import tempfile
+import platform
+import subprocess
+import tracemalloc
+import argparse as ap
+import numpy as np
+import decoder_cross
+import decoder_animacy
+import executors
+import resources
+import profiling
+from synthetic import make_dataset
+
+ncv = 5
+alpha = 'auto'
+solver = 'batched'
+sizes = [{'space': 'source', 'n_trials': 400, 'n_times': 250}, {'space': 'sens', 'n_trials': 400, 'n_times': 250}]
+quick_sizes = [{'space': 'source', 'n_trials': 100, 'n_times': 50, 'n_sessions': 3}]
+dtypes = [None, np.float32]
+backends = ['serial', 'process']
+n_sessions = 7 # unless given in the size
+history_path = './history.json'
+
+
+def make_decoder(module, dtype):
+    return module.Decoder(classification = True, alpha = alpha, ncv = ncv, scale = True, model_type = 'LDA', get_tgm = True, solver = solver, dtype = dtype)
+
+
+def grid_job(pair):
+    """One pair of sessions of the cross decoding grid, as in cross_decoding.get_accuracy."""
+    session_train, session_test = pair
+    Xsesh, ysesh, dtype = executors.shared['Xsesh'], executors.shared['ysesh'], executors.shared['dtype']
+    decoder = make_decoder(decoder_cross, dtype)
+    if session_train == session_test:
+        return decoder.run_decoding(Xsesh[session_train], ysesh[session_train], seed = session_train)
+    return decoder.run_decoding_across_sessions(Xsesh[session_train], ysesh[session_train], Xsesh[session_test], ysesh[session_test], session = session_train, seed = session_train)
+
+
+def cases(Xsesh, ysesh, dtype):
+    """(name, backend, function, number of fitted models, number of TGM cells) of every case for one dataset and dtype."""
+    T = Xsesh[0].shape[0]
+    n_train = Xsesh[0].shape[1] * (ncv - 1) // ncv
+
+    yield 'run_decoding', None, lambda: make_decoder(decoder_cross, dtype).run_decoding(Xsesh[0], ysesh[0]), ncv * T, ncv * T * T
+    yield 'run_decoding_across_sessions', None, lambda: make_decoder(decoder_cross, dtype).run_decoding_across_sessions(Xsesh[0], ysesh[0], Xsesh[1], ysesh[1]), ncv * T, ncv * T * T
+    yield 'train_test_decoding', None, lambda: make_decoder(decoder_animacy, dtype).train_test_decoding(Xsesh[0][:, :n_train], ysesh[0][:n_train], Xsesh[0][:, n_train:], ysesh[0][n_train:]), T, T * T
+
+    pairs = [(i, j) for i in range(len(Xsesh)) for j in range(len(Xsesh))]
+    for backend in backends:
+        def grid(backend = backend):
+            split = resources.plan(len(pairs))
+            data = {'Xsesh': Xsesh, 'ysesh': ysesh, 'dtype': dtype}
+            with executors.Executor(backend, split, initializer = executors.share, initargs = (data, )) as executor:
+                list(executor.map(grid_job, pairs))
+        yield 'cross_grid', backend, grid, len(pairs) * ncv * T, len(pairs) * ncv * T * T
+
+
+def measure(func):
+    """Wall time (s) of func() and, from a second run, its peak memory (MB): the peak of the traced allocations
+    of this process and the largest peak RSS of the worker processes of this case during the stages they
+    recorded (see profiling.py), None if it ran in this process."""
+    st = time.perf_counter()
+    func()
+    wall = time.perf_counter() - st
+
+    fd, path = tempfile.mkstemp(suffix = '.jsonl')
+    os.close(fd)
+    profiling.start(path)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        profiling.stop()
+
+    workers = [r['peak_rss_mb'] for r in profiling.load_trace(path) if r['pid'] != os.getpid()]
+    os.remove(path)
+
+    return wall, peak / 1024**2, max(workers) if workers else None
+
+
+def run_suite(sizes = sizes):
+    results = []
+    for size in sizes:
+        size = dict({'n_sessions': n_sessions}, **size)
+        Xsesh, ysesh = make_dataset(**size)
+        for dtype in dtypes:
+            dtype_name = np.dtype(dtype or float).name
+            for name, backend, func, fits, cells in cases(Xsesh, ysesh, dtype):
+                wall, peak, workers = measure(func)
+                result = dict(size, case = name, backend = backend, dtype = dtype_name, n_features = Xsesh[0].shape[2], wall = wall,
+                              fits_per_s = fits / wall, cells_per_s = cells / wall, peak_traced_mb = peak, peak_rss_workers_mb = workers)
+                worker_memory = f' {workers:8.0f} MB per worker' if workers is not None else ''
+                print(f'{name:30s} {size["space"]:6s} {dtype_name:7s} {backend or "":8s} {wall:8.2f} s {fits / wall:10.0f} fits/s {cells / wall:12.0f} cells/s {peak:8.0f} MB{worker_memory}')
+                results.append(result)
+
+    return results
+
+
+def machine_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {'commit': commit, 'cores': resources.available_cores(), 'platform': platform.platform(), 'python': platform.python_version(), 'numpy': np.__version__}
+
+
+def result_key(result):
+    return (result['case'], result['space'], result['n_sessions'], result['n_trials'], result['n_times'], result['dtype'], result['backend'])
+
+
+def compare(previous, results):
+    """Prints the change in throughput of every case against the previous run."""
+    before = {result_key(r): r for r in previous['results']}
+    print(f'Compared with the run of {previous["time"]} (commit {previous["machine"]["commit"]}):')
+    for r in results:
+        if result_key(r) in before:
+            ratio = r['fits_per_s'] / before[result_key(r)]['fits_per_s']
+            print(f'{r["case"]:30s} {r["space"]:6s} {r["dtype"]:7s} {r["backend"] or "":8s} {ratio:6.2f}x')
+
+
+if __name__ == '__main__':
+    parser = ap.ArgumentParser()
+    parser.add_argument('--quick', action = 'store_true', help = 'Small datasets only, to check that the suite runs')
+    parser.add_argument('--history', default = history_path, help = 'JSON file the runs are appended to')
+    parser.add_argument('--no-save', action = 'store_true', help = 'Do not append this run to the history')
+    args = parser.parse_args()
+
+    results = run_suite(quick_sizes if args.quick else sizes)
+    run = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'machine': machine_info(), 'quick': args.quick, 'results': results}
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history, 'r') as f:
+            history = json.load(f)
+    previous = [h for h in history if h.get('quick') == args.quick]
+    if previous:
+        compare(previous[-1], results)
+
+    if not args.no_save:
+        history.append(run)
+        with open(args.history, 'w') as f:
+            json.dump(history, f, indent = 4)
@@ -0,0 +1,102 @@
+"""
+Synthetic MEG-shaped datasets, for benchmarking the decoders without the recorded data.
+
+The trials of the two classes (0 = inanimate, 1 = animate) differ by a spatial pattern scaled by a
+time course that peaks after stimulus onset, on top of spatially correlated Gaussian noise. Every
+session has its own noise level, like the differences in the standard deviation between sessions
+that ERF_analysis/erf.py shows, and the number of features is that of the sensor data (306 channels)
+or of the parcellated source data (148 aparc.a2009s labels).
+
+save_bins writes a dataset in the format of subset_data/data, so the decoding scripts can be run on it.
+"""
+
+import os
+import sys
+sys.path.append('../subset_data')
+import numpy as np
+import manifest
+
+n_features = {'sens': 306, 'source': 148}
+sfreq = 250
+
+
+def signal_course(n_times, peak = 0.2, width = 0.08, sustained = 0.3):
+    """Time course (T, ) of the class difference: a transient peaking at peak seconds after onset followed by a sustained part."""
+    t = np.arange(n_times) / sfreq
+    transient = np.exp(-0.5 * ((t - peak) / width)**2)
+    sustained = sustained * (t > peak) * np.exp(-(t - peak) / 0.5)
+
+    return transient + sustained
+
+
+def make_session(n_trials, n_times = 250, space = 'source', snr = 0.3, noise_scale = 1., rng = None, pattern = None):
+    """One session of n_trials balanced trials.
+
+    Parameters
+    ----------
+    snr : peak amplitude of the class difference relative to the noise standard deviation
+    noise_scale : standard deviation of the noise of this session
+    pattern : (C, ) spatial pattern of the class difference, shared by the sessions of a dataset
+
+    Returns
+    -------
+    X : (T, N, C) trials
+    y : (N, ) labels
+    """
+    rng = np.random.default_rng(rng)
+    C = n_features[space] if isinstance(space, str) else int(space)
+    if pattern is None:
+        pattern = rng.standard_normal(C)
+        pattern /= np.linalg.norm(pattern) / np.sqrt(C)
+
+    y = rng.permutation(np.arange(n_trials) % 2)
+    # neighbouring features are correlated, as for sensors or labels seeing the same sources
+    mixing = np.eye(C) + 0.5 * np.eye(C, k = 1) + 0.5 * np.eye(C, k = -1)
+    X = np.matmul(rng.standard_normal((n_times, n_trials, C)), mixing) * (noise_scale / np.sqrt(1.5))
+
+    amplitude = snr * noise_scale * signal_course(n_times)
+    X += (y - 0.5)[None, :, None] * amplitude[:, None, None] * pattern[None, None, :]
+
+    return X, y
+
+
+def make_dataset(n_sessions = 7, n_trials = 400, n_times = 250, space = 'source', snr = 0.3, session_spread = 0.3, seed = 0):
+    """Sessions sharing one class pattern, each with its own noise level (log-normal around 1 with sd session_spread).
+
+    Returns lists Xsesh of (T, N, C) trials and ysesh of (N, ) labels, as used by cross_decoding.py.
+    """
+    rng = np.random.default_rng(seed)
+    C = n_features[space] if isinstance(space, str) else int(space)
+    pattern = rng.standard_normal(C)
+    pattern /= np.linalg.norm(pattern) / np.sqrt(C)
+    noise_scales = np.exp(session_spread * rng.standard_normal(n_sessions))
+
+    sessions = [make_session(n_trials, n_times, space, snr, scale, rng, pattern) for scale in noise_scales]
+
+    return [X for X, _ in sessions], [y for _, y in sessions]
+
+
+def save_bins(directory, Xsesh, ysesh, n_bins = 7, sens = False):
+    """Splits the trials of every session into n_bins bins and saves them like subset_data/prep_data.py.
+
+    Writes xbin.npz (or xbin_sens.npz), ybin.npy, seshinds_bins.npy and manifest.json.
+    """
+    os.makedirs(directory, exist_ok = True)
+    Xbin, ybin, seshinds = [[] for _ in range(n_bins)], [[] for _ in range(n_bins)], [[] for _ in range(n_bins)]
+    for s, (X, y) in enumerate(zip(Xsesh, ysesh)):
+        for b, inds in enumerate(np.array_split(np.arange(len(y)), n_bins)):
+            Xbin[b].append(X[:, inds])
+            ybin[b].append(y[inds])
+            seshinds[b].append(np.full(len(inds), s))
+
+    Xbin = [np.concatenate(X, axis = 1) for X in Xbin]
+    ybin, seshinds = [np.concatenate(y) for y in ybin], [np.concatenate(s) for s in seshinds]
+
+    np.savez(os.path.join(directory, 'xbin_sens.npz' if sens else 'xbin.npz'), *Xbin)
+    for name, values in [('ybin.npy', ybin), ('seshinds_bins.npy', seshinds)]:
+        array = np.empty(n_bins, dtype = object)
+        for b, v in enumerate(values):
+            array[b] = v
+        np.save(os.path.join(directory, name), array, allow_pickle = True)
+
+    manifest.write_manifest(manifest.build_manifest(ybin, seshinds), os.path.join(directory, 'manifest.json'))
@@ -0,0 +1,94 @@
+"""
+Saving and loading of decoding accuracies as regular numeric arrays.
+
+The accuracies are saved as a float .npy file that can be memory-mapped, and a JSON sidecar
+with the same name holds the index: the names of the axes, the shape and, for results with
+a different number of folds per session, how many entries along the second axis are valid
+(the rest is padded with nan).
+"""
+
+import json
+import numpy as np
+import profiling
+
+
+def index_path(path):
+    return path[:-4] + '.json' if path.endswith('.npy') else path + '.json'
+
+
+def to_numeric(accuracies):
+    """Pads a (possibly ragged) nested list of accuracies into a float array.
+
+    Returns
+    -------
+    X : float array of shape (n_outer, max_inner, ...) padded with nan
+    n_inner : number of valid entries along the second axis for each entry along the first
+    """
+    if isinstance(accuracies, np.ndarray) and accuracies.dtype != object:
+        return accuracies.astype(float), [accuracies.shape[1]] * accuracies.shape[0]
+
+    outer = [list(a) for a in accuracies]
+    n_inner = [len(a) for a in outer]
+    inner_shape = np.shape(outer[np.argmax(n_inner)][0])
+
+    X = np.full((len(outer), max(n_inner)) + inner_shape, np.nan)
+    for i, a in enumerate(outer):
+        for j, acc in enumerate(a):
+            X[i, j] = acc
+
+    return X, n_inner
+
+
+@profiling.traced('save')
+def save_accuracies(path, accuracies, dims, n_valid = None, **info):
+    """Saves accuracies as a numeric .npy file together with its JSON index.
+
+    Parameters
+    ----------
+    path : str
+        Path of the .npy file.
+    accuracies : array or nested list
+        E.g. a list over sessions of lists over folds of (T, T) accuracies.
+    dims : list of str
+        Names of the axes, e.g. ['session', 'fold', 'train_time', 'test_time'].
+    n_valid : list of int, optional
+        Number of valid entries along the second axis of an array padded with nan (e.g. folds of each session).
+    **info
+        Extra information saved in the index (model type, ncv, ...).
+    """
+    X, n_inner = to_numeric(accuracies)
+    if n_valid is not None:
+        n_inner = [int(n) for n in n_valid]
+    if len(dims) != X.ndim:
+        raise ValueError(f'Got {len(dims)} dimension names for an array with {X.ndim} dimensions')
+
+    np.save(path, X)
+    index = {'dims': list(dims), 'shape': list(X.shape), 'dtype': str(X.dtype), 'n_valid': n_inner, 'info': info}
+    with open(index_path(path), 'w') as f:
+        json.dump(index, f, indent = 4)
+
+
+def load_index(path):
+    with open(index_path(path), 'r') as f:
+        return json.load(f)
+
+
+def ensure_numeric(path, dims = None):
+    """Converts accuracies saved as an object array (as decoding.py did before) to the numeric format in place."""
+    try:
+        load_index(path)
+        return
+    except FileNotFoundError:
+        pass
+
+    accuracies = np.load(path, allow_pickle = True)
+    if dims is None:
+        X, _ = to_numeric(accuracies)
+        dims = ['session', 'fold', 'train_time', 'test_time'][:X.ndim] if X.ndim <= 4 else [f'axis_{i}' for i in range(X.ndim)]
+    save_accuracies(path, accuracies, dims, converted_from = 'object array')
+
+
+def load_accuracies(path, mmap = True):
+    """Loads accuracies memory-mapped (read-only), converting files in the old format first."""
+    ensure_numeric(path)
+    return np.load(path, mmap_mode = 'r' if mmap else None)
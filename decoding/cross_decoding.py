@@ -8,37 +8,56 @@ import mne
 import numpy as np
 import decoder_cross as decoders
 import json
-import multiprocessing as mp
+import shutil
 from datetime import datetime
 import time 
 from decoding import prep_data
+from accuracy_store import save_accuracies
+import resources
+import executors
+import profiling
 import argparse as ap
 
 classification = True
 ncv = 10
-ncores = mp.cpu_count()
-alpha = 'auto'
+threads_per_process = None # BLAS threads per worker, None lets resources.plan split the cores
+autotune = False # time a few process x thread splits on one pair of sessions first (see resources.autotune)
+backend = 'process' # executor running the pairs of sessions: 'serial', 'thread', 'process' or 'dask'
+dask_address = None # scheduler of a running Dask cluster, None starts a local cluster
+alpha = 'auto' # 'cv' selects the LDA shrinkage by nested cross validation, for RidgeClassifier a list of alphas gives accuracies for each of them
 model_type = 'LDA' # can be either LDA, SVM or RidgeClassifier
+solver = 'batched' # LDA of all time points fitted at once, 'sklearn' fits one pipeline per time point
+dtype = None # np.float32 keeps the data and the large matrix products in single precision
+window = 1 # number of adjacent samples used as features (temporal embedding)
+pseudo_k = None # average groups of pseudo_k same-class trials within each fold
+n_components = None # e.g. 60 to decode from the principal components of the training folds (sensor space)
+profile = None # e.g. './profiles/cross_decoding.jsonl' records the time and memory of each stage (see profiling.py)
+seed = None # e.g. 0 draws the folds of training session s from seed + s instead of the global NumPy state
+projection_cache = './projections' # projections of the training folds, reused by all pairs with the same training session when seed is set (cleared at the start of a run)
 now = datetime.now()
 output_path = f'./accuracies/cross_decoding_ncv_{ncv}.npy'
 
 def get_accuracy(input:tuple, classification=classification, ncv=ncv):
-    decoder = decoders.Decoder(classification=classification, ncv = ncv, alpha = alpha, scale = True, model_type = model_type, get_tgm=True)
+    # the sessions and the cache of this run (sensor or source space) are shared with the workers once, see executors.share
+    Xsesh, ysesh, cache = executors.shared['Xsesh'], executors.shared['ysesh'], executors.shared['projection_cache']
+
+    decoder = decoders.Decoder(classification=classification, ncv = ncv, alpha = alpha, scale = True, model_type = model_type, get_tgm=True, solver = solver, dtype = dtype, window = window, pseudo_k = pseudo_k, n_components = n_components, projection_cache = cache)
     (session_train, session_test, idx) = input
 
-    if session_test == session_train: # avoiding double dipping within session, by using within session decoder
-        X = Xsesh[session_train]
-        y = ysesh[session_train]
-        accuracy = decoder.run_decoding(X, y)
+    with profiling.stage('pair', train_session = session_train, test_session = session_test):
+        if session_test == session_train: # avoiding double dipping within session, by using within session decoder
+            X = Xsesh[session_train]
+            y = ysesh[session_train]
+            accuracy = decoder.run_decoding(X, y, seed = None if seed is None else seed + session_train)
 
-    else:
-        X_train = Xsesh[session_train]
-        X_test = Xsesh[session_test]
+        else:
+            X_train = Xsesh[session_train]
+            X_test = Xsesh[session_test]
 
-        y_train = ysesh[session_train]
-        y_test = ysesh[session_test]
+            y_train = ysesh[session_train]
+            y_test = ysesh[session_test]
 
-        accuracy = decoder.run_decoding_across_sessions(X_train, y_train, X_test, y_test)
+            accuracy = decoder.run_decoding_across_sessions(X_train, y_train, X_test, y_test, session = session_train, seed = None if seed is None else seed + session_train)
     print(f'Index {idx} done')
 
     return session_train, session_test, accuracy
@@ -57,31 +76,52 @@ if __name__ == '__main__':
     else:
         output_path = f'./accuracies/cross_decoding_sens_ncv_{ncv}.npy'
 
+    cache = f'{projection_cache}/{"sens" if sens else "source"}'
+    shutil.rmtree(cache, ignore_errors = True)
+
+
+    if profile:
+        profiling.start(profile)
 
     st = time.time()
-    Xbin, ybin, Xsesh, ysesh = prep_data(sens = sens)
-    del Xbin, ybin
+    with profiling.stage('load', sens = bool(sens)):
+        Xbin, ybin, Xsesh, ysesh = prep_data(sens = sens, dtype = dtype)
+        del Xbin, ybin
 
-    Xsesh = [np.concatenate(i, axis = 2) for i in Xsesh]
-    Xsesh = [np.transpose(i.squeeze(), (0,1,2)) for i in Xsesh]
-    ysesh = [np.concatenate(i, axis = 0) for i in ysesh]
+        Xsesh = [np.concatenate(i, axis = 2) for i in Xsesh]
+        Xsesh = [np.transpose(i.squeeze(), (0,1,2)) for i in Xsesh]
+        ysesh = [np.concatenate(i, axis = 0) for i in ysesh]
 
     for i in range(len(Xsesh)):
         print(Xsesh[i].shape, ysesh[i].shape)
 
     decoding_inputs = [(train_sesh, test_sesh, idx) for idx, train_sesh in enumerate(range(len(Xsesh))) for test_sesh in range(len(Xsesh))]
     
-    accuracies = np.zeros((len(Xsesh), len(Xsesh), 250, 250), dtype=float)
-    with mp.Pool(ncores) as p:
-        for train_session, test_session, accuracy in p.map(get_accuracy, decoding_inputs):
-            accuracies[train_session, test_session, :, :] = accuracy
-    
-    p.close()
-    p.join()
+    data = {'Xsesh': Xsesh, 'ysesh': ysesh, 'projection_cache': cache}
+    executors.share(data)
 
+    split = resources.plan(len(decoding_inputs), threads_per_process)
+    if autotune:
+        split, _ = resources.autotune(lambda: get_accuracy((0, 1, -1)), len(decoding_inputs))
+    print(f'{split.n_processes} processes x {split.threads} BLAS threads')
+
+    with executors.Executor(backend, split, initializer = executors.share, initargs = (data, ), address = dask_address) as executor:
+        results, stats = executors.timed_map(executor, get_accuracy, decoding_inputs)
+    print(f'{stats["n_tasks"]} pairs on {stats["n_workers"]} {backend} workers, efficiency {stats["efficiency"]:.2f}, overhead per pair {stats["overhead_per_task"]:.2f} s')
+
+    accuracies = None
+    for train_session, test_session, accuracy in results:
+        if accuracies is None:
+            accuracies = np.zeros((len(Xsesh), len(Xsesh)) + accuracy.shape, dtype=float)
+        accuracies[train_session, test_session] = accuracy
 
-    
     et = time.time()
     print(f'Time taken: {et-st}')
 
-    np.save(output_path, accuracies)
\ No newline at end of file
+    dims = ['train_session', 'test_session', 'train_time', 'test_time']
+    if np.ndim(alpha) == 1: # grid of alphas
+        dims.insert(2, 'alpha')
+    save_accuracies(output_path, accuracies, dims, model_type = model_type, alpha = alpha, ncv = ncv, sens = bool(sens), dtype = np.dtype(dtype or float).name, window = window, pseudo_k = pseudo_k, n_components = n_components, seed = seed)
+
+    if profiling.enabled():
+        profiling.report(profiling.trace_path())
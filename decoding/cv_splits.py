@@ -0,0 +1,57 @@
+"""
+Cross-validation splits as index arrays into one backing tensor of all trials.
+
+The bins are concatenated once (stack_bins) and every scheme yields (session, train, test) with the
+trial indices of the training and testing partition, so nothing is copied or re-concatenated when
+splitting. The indices of a partition are sorted by bin, as the trials of the old bin lists were.
+"""
+
+import numpy as np
+
+
+def stack_bins(Xbin, ybin, sessioninds):
+    """Concatenates the bins (T, N_b, C) along the trials.
+
+    Returns
+    -------
+    X : (T, N, C) all trials
+    y : (N, ) labels
+    session : (N, ) session of each trial
+    bins : (N, ) bin of each trial
+    """
+    X = np.concatenate(Xbin, axis = 1)
+    y = np.concatenate([np.asarray(y_b) for y_b in ybin])
+    session = np.concatenate(sessioninds)
+    bins = np.concatenate([np.full(len(s), b) for b, s in enumerate(sessioninds)])
+
+    return X, y, session, bins
+
+
+def leave_bin_out(session, bins):
+    """For every session and each of its bins: trains on the other bins of the session and tests on the bin."""
+    for s in np.unique(session):
+        for b in np.unique(bins[session == s]):
+            yield s, np.nonzero((session == s) & (bins != b))[0], np.nonzero((session == s) & (bins == b))[0]
+
+
+def proportional(session, bins, ncv, rng = np.random):
+    """Stratified by bin: the trials of every bin of a session are shuffled and split into ncv parts, fold i tests on part i of all bins.
+
+    The random draws are the same as in the former decoding.train_test_split_prop, so a seeded run gives the same folds.
+    """
+    for s in np.unique(session):
+        parts = []
+        for b in np.unique(bins[session == s]):
+            trials = np.nonzero((session == s) & (bins == b))[0]
+            parts.append(np.array_split(trials[rng.choice(len(trials), size = len(trials), replace = False)], ncv))
+
+        for i in range(ncv):
+            test = np.concatenate([p[i] for p in parts])
+            train = np.nonzero(session == s)[0]
+            yield s, np.setdiff1d(train, test, assume_unique = True), test
+
+
+def leave_session_out(session):
+    """Trains on all sessions but one and tests on the held out session."""
+    for s in np.unique(session):
+        yield s, np.nonzero(session != s)[0], np.nonzero(session == s)[0]
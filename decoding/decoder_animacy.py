@@ -3,24 +3,101 @@ Decoding class used for Bachelor's thesis.
 
 Author: Laura Bock Paulsen
 """
+import os
+import tempfile
 import numpy as np
 from sklearn.discriminant_analysis import LinearDiscriminantAnalysis as LDA
-from sklearn.linear_model import RidgeClassifier
 from sklearn.svm import LinearSVC
 from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import make_pipeline
+import profiling
+from pseudo_trials import pseudo_folds
+from projection import fit_pca, apply_projection, cached_projection, index_digest
+from model_bundle import write_bundle
+from linear_models import as_dtype, scaler_params, standardize, window_view, ridge_path, ridge_scores, lda_fit, lda_nested_shrinkage, score, score_tiles, tgm_buffer, adaptive_tgm
 
 class Decoder():
-    def __init__(self, classification, alpha, ncv, scale, model_type = 'LDA', get_tgm = True):
+    def __init__(self, classification, alpha, ncv, scale, model_type = 'LDA', get_tgm = True, alpha_grid = None, ncv_inner = 5, solver = 'sklearn', dtype = None, tile_size = None, band = None, tgm_path = None, adaptive_step = None, refine_threshold = None, window = 1, pseudo_k = None, n_resamples = 1, n_components = None, whiten = False, projection_cache = None, labels = None, get_confusion = False, keep_models = False):
+            """
+            alpha = 'cv' selects the LDA shrinkage of each time point among alpha_grid by nested cross validation
+            with ncv_inner folds on the training data. The selected values are appended to selected_alphas for each fold.
+
+            solver = 'batched' fits the LDA of all time points at once with NumPy (including a vectorised Ledoit-Wolf
+            estimate for alpha = 'auto') instead of one scikit-learn pipeline per time point. The models are the same.
+
+            dtype = np.float32 keeps the data and the large matrix products in single precision, halving memory and
+            bandwidth. Means, variances and the (C, C) decompositions are still accumulated in float64.
+
+            For long epochs the TGM can be evaluated in (tile_size, tile_size) tiles, only within band = k samples of the
+            diagonal (nan elsewhere) and accumulated over folds in a memory-mapped .npy file, which is returned instead of
+            an in-memory array. Every call writes its own file named after tgm_path (e.g. tgm_x8k2l1.npy for tgm.npy, see
+            the filename of the returned array), so calls running at the same time do not share a buffer. These options
+            need the batched models (RidgeClassifier with one alpha, or LDA with solver = 'batched' or alpha = 'cv').
+
+            adaptive_step = s first evaluates the TGM on every s-th training and testing time and only evaluates the cells
+            between coarse points above refine_threshold (e.g. the binomial chance level from plots.chance_level, defaults
+            to 1 / number of classes) at full resolution. The other cells are interpolated, their mask is appended to
+            interpolated for each call. Meant for exploratory runs, needs the batched models as well.
+
+            window = w trains on windows of w adjacent samples (C * w features) instead of single time points, giving
+            T - w + 1 time points labelled by the first sample of the window. The windows are strided views of the data and
+            the batched LDA builds their scatter matrices from shared lagged cross-products. Supported for LDA and SVM with
+            the default TGM evaluation.
+
+            pseudo_k = k averages random groups of k same-class trials within the training and the testing partition of
+            every fold (see pseudo_trials.py), n_resamples times per fold; the accuracies are averaged over the resamples.
+
+            n_components = d projects the data of every fold on the first d principal components of its training data
+            (whitened if whiten is True, see projection.py). With projection_cache set to a directory, the projections of
+            the training folds of run_decoding_across_sessions are saved per (session, fold) when it gets a session index
+            and a seed, which draws the training folds, so every pair with the same training session reuses them. Without
+            a seed the folds are drawn from the global NumPy state as before and nothing is cached.
+
+            labels fixes the class values (e.g. all stimulus triggers for multiclass decoding), so they are numbered the same
+            way in every session. With get_confusion the batched models also count true against predicted classes for the
+            models tested on their own time point; the (T, K, K) counts are summed into confusion over folds and calls.
+
+            keep_models keeps the weights, intercepts, scaler statistics, shrinkage (the Ledoit-Wolf intensity of every
+            class for alpha = 'auto') and (for window = 1) the covariance of the standardised training data of every fitted
+            fold, until save_bundle writes them as a float32 bundle (see model_bundle.py) that can be scored and turned into
+            activation patterns without refitting. The covariances take T x C^2 floats per fold. Needs the batched models.
+            """
             self.classification = classification
             self.alpha = alpha
             self.ncv = ncv
             self.scale = scale
             self.model_type = model_type
             self.get_tgm = get_tgm
-
-    
-    def check_y_format(self,y):
+            self.alpha_grid = np.linspace(0, 1, 11) if alpha_grid is None else np.asarray(alpha_grid)
+            self.ncv_inner = ncv_inner
+            self.selected_alphas = []
+            self.solver = solver
+            self.dtype = dtype
+            self.tile_size = tile_size
+            self.band = band
+            self.tgm_path = tgm_path
+            self.adaptive_step = adaptive_step
+            self.refine_threshold = refine_threshold
+            self.interpolated = []
+            self.window = window
+            self.pseudo_k = pseudo_k
+            self.n_resamples = n_resamples
+            self.n_components = n_components
+            self.whiten = whiten
+            self.projection_cache = projection_cache
+            self.labels = labels
+            self.get_confusion = get_confusion
+            self.confusion = None
+            self.keep_models = keep_models
+            self.models = []
+            self.class_values = None
+
+            if window > 1 and (model_type == 'RidgeClassifier' or (isinstance(alpha, str) and alpha == 'cv') or tile_size or band is not None or tgm_path or adaptive_step):
+                raise ValueError('window > 1 is supported for LDA (not alpha = \'cv\') and SVM with the default TGM evaluation')
+
+
+    def check_y_format(self,y, train = False):
+        """Numbers the classes 1..K. With train the class values are kept (class_values) for the model bundles."""
         y = np.copy(y)
         y = y * 1 # convert to int if it was Boolean 
         if not self.classification:
@@ -28,19 +105,163 @@ class Decoder():
             return y
 
         y = y.astype(int)
-        values = np.unique(y)
+        values = np.unique(y) if self.labels is None else np.asarray(self.labels)
         ycopy = np.copy(y)
         for k in range(len(values)):
             y[ycopy == values[k]] = k+1
+        if train:
+            self.class_values = values
 
         return y
 
     
-    def train_test_decoding(self, X_train, y_train, X_test, y_test):
-        T = X_train.shape[0] # T = time
-
-        y_train = self.check_y_format(y_train)
-        y_test = self.check_y_format(y_test)
+    def _batched(self):
+        if self.model_type == 'RidgeClassifier':
+            return np.ndim(self.alpha) == 0
+        return self.model_type == 'LDA' and (self.solver == 'batched' or (isinstance(self.alpha, str) and self.alpha == 'cv'))
+
+
+    def _check_batched(self, feature):
+        if not self._batched():
+            raise ValueError(f'{feature} need a RidgeClassifier with one alpha or LDA with solver = \'batched\' or alpha = \'cv\'')
+
+
+    def _new_tgm(self, T_train, T_test):
+        """TGM accumulator for tiled or band evaluation, None for the default in-memory evaluation."""
+        if not self.get_tgm or (self.tile_size is None and self.band is None and self.tgm_path is None):
+            return None
+        self._check_batched('Tiled and band TGMs')
+
+        path = None
+        if self.tgm_path is not None:
+            # a new file for every call, so concurrent folds or sessions do not overwrite each other's buffer
+            root, ext = os.path.splitext(self.tgm_path)
+            fd, path = tempfile.mkstemp(suffix = ext or '.npy', prefix = os.path.basename(root) + '_', dir = os.path.dirname(root) or '.')
+            os.close(fd)
+
+        return tgm_buffer(T_train, T_test, band = self.band, path = path)
+
+
+    def _fit_fold(self, X_train, y_train, rng = np.random):
+        """Fits the batched models of all time points, returns coef (T, C, K), intercept (T, K) and classes.
+
+        rng draws the inner folds of alpha = 'cv'.
+        """
+        if self.model_type == 'RidgeClassifier':
+            coef, intercept, classes = ridge_path(X_train, y_train, [self.alpha])
+            coef, intercept, shrinkage = coef[0], intercept[0], self.alpha
+        elif isinstance(self.alpha, str) and self.alpha == 'cv':
+            # shrinkage of each time point selected on the training data, the whole shrinkage path is evaluated per inner fold
+            shrinkage, _ = lda_nested_shrinkage(X_train, y_train, self.alpha_grid, self.ncv_inner, rng = rng)
+            self.selected_alphas.append(shrinkage)
+            coef, intercept, classes = lda_fit(X_train, y_train, shrinkage)
+        else:
+            # for 'auto' the Ledoit-Wolf intensity of every class (T, n_classes)
+            coef, intercept, classes, shrinkage = lda_fit(X_train, y_train, self.alpha, window = self.window, return_shrinkage = True)
+
+        if self.keep_models:
+            self._keep_model(X_train, coef, intercept, shrinkage, classes)
+
+        return coef, intercept, classes
+
+
+    def _keep_model(self, X_train, coef, intercept, shrinkage, classes):
+        """Stores the models of a fold in the form of model_bundle.py, with the weights on standardised data."""
+        mean, scale = scaler_params(X_train)
+        covariance = None
+        if self.window == 1:
+            X_std = standardize(X_train, mean, scale)
+            covariance = (np.matmul(X_std.transpose(0, 2, 1), X_std) / X_train.shape[1]).astype(np.float32)
+        else:
+            # scaler statistics of the window features, feature c * window + i is channel c at sample t + i
+            mean, scale = [window_view(a[:, None, :], self.window)[:, 0].reshape(len(coef), -1) for a in (mean, scale)]
+
+        self.models.append({
+            'coef': (coef * scale[..., None]).astype(np.float32),
+            'intercept': (intercept + np.sum(mean[..., None] * coef, axis = -2)).astype(np.float32),
+            'mean': mean.astype(np.float32),
+            'scale': scale.astype(np.float32),
+            'shrinkage': np.broadcast_to(shrinkage, (len(coef), ) + np.shape(shrinkage)[1:]).astype(np.float32),
+            'covariance': covariance,
+            'classes': classes,
+            # values of the classes before they were numbered 1..K by check_y_format
+            'labels': None if self.class_values is None else self.class_values[np.asarray(classes) - 1]})
+
+
+    def save_bundle(self, path, unit_scale = 1., **info):
+        """Writes the models kept since the last call (one per fold, see keep_models) to a bundle at path (.npy) and clears them.
+
+        unit_scale is the factor the data was multiplied by when it was loaded (e.g. decoding.sens_unit for sensor data
+        in fT), so the bundle can be applied to data in the recorded units.
+        """
+        if not self.models:
+            raise ValueError('No models to save, fit the decoder with keep_models = True first')
+
+        arrays = {name: np.stack([m[name] for m in self.models]) for name in ['coef', 'intercept', 'mean', 'scale', 'shrinkage']}
+        if all(m['covariance'] is not None for m in self.models):
+            arrays['covariance'] = np.stack([m['covariance'] for m in self.models])
+
+        write_bundle(path, arrays, self.models[0]['classes'], labels = self.models[0]['labels'], dtype = np.dtype(self.dtype or float).name, unit_scale = unit_scale,
+                     model_type = self.model_type, alpha = str(self.alpha), window = self.window, **info)
+        self.models = []
+
+
+    def _project(self, X_train, X_test, key = None):
+        """PCA of the training data of a fold applied to both partitions, loaded from projection_cache if key is given."""
+        if self.n_components is None:
+            return X_train, X_test
+
+        fit = lambda: fit_pca(X_train, self.n_components, whiten = self.whiten)
+        if key is None or self.projection_cache is None:
+            projection = fit()
+        else:
+            projection = cached_projection(self.projection_cache, f'{key}_d{self.n_components}{"_white" if self.whiten else ""}', fit)
+
+        return apply_projection(X_train, projection), apply_projection(X_test, projection)
+
+
+    def _features(self, X, t):
+        """Features (N, C) at time t of X, or (N, C * window) of the window starting at t."""
+        if self.window == 1:
+            return X[t, :, :]
+        return window_view(X, self.window)[t].reshape(X.shape[1], -1)
+
+
+    def _score_fold(self, X_train, y_train, X_test, y_test, out = None, weight = 1., rng = np.random):
+        """
+        Trains a model on each time point of X_train and scores it on X_test.
+        Returns (T, T) scores, or (T, ) if get_tgm is False. A RidgeClassifier with a list of alphas gives (n_alphas, T, T).
+        If out (see _new_tgm) is given, weight times the scores are added to it tile by tile and out is returned.
+        """
+        if out is not None:
+            with profiling.stage('fit'):
+                coef, intercept, classes = self._fit_fold(X_train, y_train, rng)
+            with profiling.stage('tgm'):
+                return score_tiles(coef, intercept, X_test, y_test, classes, out, weight, tile_size = self.tile_size or 100, band = self.band)
+
+        if self.model_type == 'RidgeClassifier' and not self.keep_models:
+            # one eigendecomposition per time point for all values of alpha
+            with profiling.stage('fit_and_tgm'):
+                return ridge_scores(X_train, y_train, X_test, y_test, self.alpha, get_tgm = self.get_tgm)
+
+        if self._batched():
+            with profiling.stage('fit'):
+                coef, intercept, classes = self._fit_fold(X_train, y_train, rng)
+            if not self.get_confusion:
+                with profiling.stage('tgm'):
+                    return score(coef, intercept, X_test, y_test, classes, get_tgm = self.get_tgm, window = self.window)
+
+            # confusion matrices from the same predictions as the accuracies
+            labels = np.arange(1, len(self.labels) + 1) if self.labels is not None else np.union1d(y_train, y_test)
+            with profiling.stage('tgm'):
+                scores, confusion = score(coef, intercept, X_test, y_test, classes, get_tgm = self.get_tgm, window = self.window, labels = labels)
+            self.confusion = confusion if self.confusion is None else self.confusion + confusion
+            return scores
+
+        if self.get_confusion:
+            raise ValueError('Confusion matrices need the batched models')
+
+        T = X_train.shape[0] - self.window + 1 # T = time
 
         if self.get_tgm:
             scores = np.zeros((T,T))
@@ -48,88 +269,131 @@ class Decoder():
         elif not self.get_tgm:
             scores = np.zeros(T)
 
-        for t in range(T):
-            X_t = X_train[t, :, :]
-            if self.model_type == 'LDA':
-                model = make_pipeline(StandardScaler(), LDA(solver = 'lsqr', shrinkage = self.alpha))
-            elif self.model_type == 'RidgeClassifier':
-                model = make_pipeline(StandardScaler(), RidgeClassifier(solver = 'lsqr'), shrinkage = self.alpha)
-            else:
-                print('Decoder only supports LDA, SVM or RidgeClassifier')
+        # fitting and scoring alternate between time points, so they are timed as one stage
+        with profiling.stage('fit_and_tgm'):
+            for t in range(T):
+                X_t = self._features(X_train, t)
+                if self.model_type == 'LDA':
+                    model = make_pipeline(StandardScaler(), LDA(solver = 'lsqr', shrinkage = self.alpha))
+                elif self.model_type == 'SVM':
+                    model = make_pipeline(StandardScaler(), LinearSVC(random_state = 0, max_iter = 2000, class_weight = 'balanced', dual = True, fit_intercept = False))
+                else:
+                    print('Decoder only supports LDA, SVM or RidgeClassifier')
 
-            model.fit(X_t, y_train)
+                model.fit(X_t, y_train)
 
-            if self.get_tgm:
-                for t2 in range(T):
-                    X_t2 = X_test[t2, :, :]
-                    scores[t, t2] = model.score(X_t2, y_test)
+                if self.get_tgm:
+                    for t2 in range(T):
+                        X_t2 = self._features(X_test, t2)
+                        scores[t, t2] = model.score(X_t2, y_test)
 
-            elif not self.get_tgm:
-                X_t2 = X_test[t, :, :]
-                scores[t] = model.score(X_t2, y_test)
+                elif not self.get_tgm:
+                    X_t2 = self._features(X_test, t)
+                    scores[t] = model.score(X_t2, y_test)
 
         return scores
 
+    
+    def _run_folds(self, folds, n_folds, T_train, T_test, rng = np.random):
+        """
+        Scores the (X_train, y_train, X_test, y_test) folds yielded by folds and averages the scores over folds.
+        With adaptive_step the models of all folds are fitted first and the TGM is refined where the fold average
+        of the coarse grid is above refine_threshold. rng draws the pseudo-trials and the inner folds of alpha = 'cv'.
+        """
+        if self.keep_models:
+            self._check_batched('Model bundles')
+
+        if self.pseudo_k is not None:
+            folds = pseudo_folds(folds, self.pseudo_k, self.n_resamples, rng)
+            n_folds = n_folds * self.n_resamples
+
+        if self.adaptive_step is not None and self.get_tgm:
+            self._check_batched('Adaptive TGMs')
+            fitted = []
+            for fold, (X_train, y_train, X_test, y_test) in enumerate(folds):
+                with profiling.stage('fit', cv_fold = fold):
+                    fitted.append(self._fit_fold(X_train, y_train, rng) + (X_test, y_test))
+            threshold = self.refine_threshold if self.refine_threshold is not None else 1 / len(fitted[0][2])
+            with profiling.stage('tgm'):
+                accuracies, interpolated = adaptive_tgm(fitted, self.adaptive_step, threshold)
+            self.interpolated.append(interpolated)
+            return accuracies
+
+        tgm = self._new_tgm(T_train, T_test)
+        scores = []
+
+        for fold, (X_train, y_train, X_test, y_test) in enumerate(folds):
+            with profiling.stage('fold', cv_fold = fold):
+                if tgm is None:
+                    scores.append(self._score_fold(X_train, y_train, X_test, y_test, rng = rng))
+                else:
+                    self._score_fold(X_train, y_train, X_test, y_test, out = tgm, weight = 1 / n_folds, rng = rng)
+
+        if tgm is not None:
+            return tgm
+
+        # average over folds
+        accuracies = np.mean(scores, axis = 0)
+
+        return accuracies
+
 
-    def run_decoding_across_sessions(self, X_train, y_train, X_test, y_test):
+    def train_test_decoding(self, X_train, y_train, X_test, y_test, rng = np.random):
+        """Trains on X_train and tests on X_test. rng (e.g. np.random.default_rng(seed)) draws the pseudo-trials and
+        the inner folds of alpha = 'cv', by default from the global NumPy state."""
+        X_train, X_test = as_dtype(X_train, self.dtype), as_dtype(X_test, self.dtype)
+        y_train = self.check_y_format(y_train, train = True)
+        y_test = self.check_y_format(y_test)
+        X_train, X_test = self._project(X_train, X_test)
+
+        return self._run_folds([(X_train, y_train, X_test, y_test)], 1, X_train.shape[0], X_test.shape[0], rng)
+
+
+    def run_decoding_across_sessions(self, X_train, y_train, X_test, y_test, session = None, seed = None):
+        X_train, X_test = as_dtype(X_train, self.dtype), as_dtype(X_test, self.dtype)
         T, N_train, C  = X_train.shape # T = time, N = trials, C = channels
         T, N_test, C = X_test.shape # T = time, N = trials, C = channels
 
 
-        y_train = self.check_y_format(y_train)
+        y_train = self.check_y_format(y_train, train = True)
         y_test = self.check_y_format(y_test)
 
         inds_train = np.array(range(N_train))
         inds_test = np.array(range(N_test))
-        np.random.shuffle(inds_train)
+        # with a seed the training folds of a session are the same in every call, so their projections can be reused
+        (np.random if seed is None else np.random.RandomState(seed)).shuffle(inds_train)
         np.random.shuffle(inds_test)
 
-        if self.get_tgm:
-            scores = np.zeros((T,T, self.ncv))
+        def folds():
+            for c in range(self.ncv):
+                # gathering (and projecting) the partitions of the fold
+                with profiling.stage('split', cv_fold = c):
+                    inds_tmp_train = inds_train[:]
+                    inds_tmp_train = np.delete(inds_tmp_train, slice(int(len(inds_tmp_train)/self.ncv) * c, int(len(inds_tmp_train)/self.ncv)*(c+1)))
                 
-        elif not self.get_tgm:
-            scores = np.zeros((T, self.ncv))
-
-        for c in range(self.ncv):
-            inds_tmp_train = inds_train[:]
-            inds_tmp_train = np.delete(inds_tmp_train, slice(int(len(inds_tmp_train)/self.ncv) * c, int(len(inds_tmp_train)/self.ncv)*(c+1)))
+                    inds_tmp_test = inds_test[int(len(inds_test)/self.ncv) * c : int(len(inds_test)/self.ncv)*(c+1)]
             
-            inds_tmp_test = inds_test[int(len(inds_test)/self.ncv) * c : int(len(inds_test)/self.ncv)*(c+1)]
 
-            X_train_tmp = np.delete(X_train, inds_tmp_train, axis=1)
-            y_train_tmp = np.delete(y_train, inds_tmp_train)
+                    X_train_tmp = np.delete(X_train, inds_tmp_train, axis=1)
+                    y_train_tmp = np.delete(y_train, inds_tmp_train)
 
-            X_test_tmp = X_test[:, inds_tmp_test, :]
-            y_test_tmp = y_test[inds_tmp_test]
+                    X_test_tmp = X_test[:, inds_tmp_test, :]
+                    y_test_tmp = y_test[inds_tmp_test]
 
-            for t in range(T):
-                X_t = X_train_tmp[t, :, :]
+                    key = None if session is None or seed is None else f'{session}_across_{c}_{index_digest(inds_tmp_train)}'
+                    X_train_tmp, X_test_tmp = self._project(X_train_tmp, X_test_tmp, key)
 
-                if self.model_type == 'LDA':
-                    model = make_pipeline(StandardScaler(), LDA(solver = 'lsqr', shrinkage = self.alpha))
-                elif self.model_type == 'RidgeClassifier':
-                    model = make_pipeline(StandardScaler(), RidgeClassifier(solver = 'lsqr'), shrinkage = self.alpha)
-                else:
-                    print('Decoder only supports LDA, SVM or RidgeClassifier')
+                yield X_train_tmp, y_train_tmp, X_test_tmp, y_test_tmp
 
-                model.fit(X_t, y_train_tmp)
+        return self._run_folds(folds(), self.ncv, T, T)
 
-                if self.get_tgm:
-                    for t2 in range(T):
-                        X_t2 = X_test_tmp[t2, :, :]
-                        scores[t, t2, c] = model.score(X_t2, y_test_tmp)
 
-                elif not self.get_tgm:
-                    X_t2 = X_test_tmp[t, :, :]
-                    scores[t, c] = model.score(X_t2, y_test_tmp)
-                    
-            if self.get_tgm:        
-                accuracies = np.mean(scores, axis = 2)
-
-            elif not self.get_tgm:
-                accuracies = np.mean(scores, axis = 1)
-
-
-        return accuracies
+    def index_decoding(self, X, y, inds_train, inds_test, rng = np.random):
+        """train_test_decoding on the trials inds_train and inds_test of X (T, N, C), e.g. the splits of cv_splits.py.
 
+        The partitions are only gathered here, when the fold is fitted.
+        """
+        with profiling.stage('split'):
+            X_train, y_train, X_test, y_test = X[:, inds_train], y[inds_train], X[:, inds_test], y[inds_test]
 
+        return self.train_test_decoding(X_train, y_train, X_test, y_test, rng)
@@ -7,34 +7,91 @@ This script runs decoding on the MEG data using two different cross-validation (
 Usage: python decoding.py
 """
 
+import os
 import sys
+import copy
+import zlib
+sys.path.append('../subset_data')
+import manifest
 import decoder_animacy as decoder
+import cv_splits
+import resources
+import executors
+import profiling
 import numpy as np
+from accuracy_store import save_accuracies
+from linear_models import as_dtype
 
 classification = True
 ncv = 7
-alpha = 0.1
+alpha = 0.1 # 'cv' selects the shrinkage of each time point by nested cross validation
 model_type = 'LDA'
+solver = 'batched' # LDA of all time points fitted at once, 'sklearn' fits one pipeline per time point
 get_tgm = True
+dtype = None # np.float32 halves memory and bandwidth, see accuracy_deviation
+adaptive_step = None # e.g. 5 for exploratory runs, only refines the TGM above the binomial chance level
+window = 1 # number of adjacent samples used as features (temporal embedding)
+pseudo_k = None # average groups of pseudo_k same-class trials within each fold
+seed = 0 # the random draws of every (scheme, session, fold) task are seeded from (seed, scheme, session, fold)
+target = 'animacy' # 'trigger' decodes the individual stimuli (multiclass) and saves confusion matrices
+save_models = False # writes the fitted models of each session to ./models as a bundle (see model_bundle.py)
+backend = 'process' # executor running the (scheme, session, fold) tasks: 'serial', 'thread', 'process' or 'dask'
+threads_per_process = None # BLAS threads per worker, None lets resources.plan split the cores
+profile = None # e.g. './profiles/decoding.jsonl' records the time and memory of each stage (see profiling.py)
 
-def load_data(sens = False):
+sens_unit = 1e15 # sensor data is converted from T to fT when cast to a lower precision
+
+def label_path(target = 'animacy'):
+    """Labels of the trials in each bin: animacy (0/1) or the stimulus triggers."""
+    if target == 'animacy':
+        return '../subset_data/data/ybin.npy'
+    if target == 'trigger':
+        return '../subset_data/data/triggerbin.npy'
+    raise ValueError(f'Unknown target {target}, use animacy or trigger')
+
+def data_unit(sens = False, dtype = None):
+    """Factor the data is multiplied by when it is loaded with dtype (see linear_models.as_dtype)."""
+    return sens_unit if sens and dtype is not None else 1.
+
+def load_data(sens = False, dtype = None, target = 'animacy'):
     if not sens:
         Xbin_load  = np.load(f'../subset_data/data/xbin.npz', allow_pickle=True)
     else:
         Xbin_load  = np.load(f'../subset_data/data/xbin_sens.npz', allow_pickle=True)
 
-    ybin_load = np.load(f'../subset_data/data/ybin.npy', allow_pickle=True)
+    ybin_load = np.load(label_path(target), allow_pickle=True)
     sessioninds_load = np.load(f'../subset_data/data/seshinds_bins.npy', allow_pickle=True)
 
     # unpack the loaded data
-    Xbin = [Xbin_load[f'arr_{i}']for i in range(ncv)]
+    Xbin = [as_dtype(Xbin_load[f'arr_{i}'], dtype, data_unit(sens, dtype)) for i in range(ncv)]
     ybin = [ybin_load[i]for i in range(ybin_load.shape[0])]
     sessioninds = [np.array(sessioninds_load[i])for i in range(ncv)]
 
     return Xbin, ybin, sessioninds
 
-def prep_data(sens = False):
-    Xbin, ybin, sessioninds = load_data(sens = sens)
+def iter_bins(sens = False, dtype = None, target = 'animacy'):
+    """Yields one bin at a time instead of loading all bins into memory.
+
+    Yields
+    ------
+    b : index of the bin
+    X : (T, N, C) trials in the bin
+    y : (N, ) labels of the trials
+    sessioninds : (N, ) session index of each trial
+    """
+    if not sens:
+        Xbin_load  = np.load(f'../subset_data/data/xbin.npz', allow_pickle=True)
+    else:
+        Xbin_load  = np.load(f'../subset_data/data/xbin_sens.npz', allow_pickle=True)
+
+    ybin_load = np.load(label_path(target), allow_pickle=True)
+    sessioninds_load = np.load(f'../subset_data/data/seshinds_bins.npy', allow_pickle=True)
+
+    for b in range(ncv):
+        yield b, as_dtype(Xbin_load[f'arr_{b}'], dtype, data_unit(sens, dtype)), np.array(ybin_load[b]), np.array(sessioninds_load[b])
+
+def prep_data(sens = False, dtype = None, target = 'animacy'):
+    Xbin, ybin, sessioninds = load_data(sens = sens, dtype = dtype, target = target)
     # create empty lists for each session
     Xsesh = [[] for i in range(ncv)]
     ysesh = [[] for i in range(ncv)]
@@ -50,91 +107,162 @@ def prep_data(sens = False):
        
     return Xbin, ybin, Xsesh, ysesh
 
-def concat_bins(Xsesh, ysesh):
-    X = np.concatenate([Xsesh[i].squeeze() for i in range(len(Xsesh))], axis=1)
-    y = np.concatenate([ysesh[i] for i in range(len(ysesh))], axis=0)
-    return X, y
+def within_tasks(session, bins, schemes = ('prop', 'lbo')):
+    """(scheme, session, fold, train, test) tasks of the within session schemes, 'prop' (proportional) and 'lbo' (leave bin out)."""
+    for scheme in schemes:
+        splits = cv_splits.proportional(session, bins, ncv) if scheme == 'prop' else cv_splits.leave_bin_out(session, bins)
+        folds = {}
+        for s, train, test in splits:
+            folds[s] = folds.get(s, -1) + 1
+            yield scheme, s, folds[s], train, test
 
 
-def run_decoding_leave_bin_out(Xsesh, ysesh, decoder):
-    accuracies = [[], [], [], [], [], [], []]
-    for session in range(len(Xsesh)):
-        for i in range(len(Xsesh[session])):
-            bins = Xsesh[session]
-            ys = ysesh[session]
+def task_rng(scheme, session, fold, seed = seed):
+    """Random generator of a task, the same whichever worker runs it (pseudo-trials, inner folds of alpha = 'cv')."""
+    return np.random.default_rng([seed, zlib.crc32(scheme.encode()), int(session), int(fold)])
 
-            X_test = bins[i].squeeze()
-            y_test = ys[i]
 
-            X_train = bins[:]
-            X_train.pop(i)
-            y_train = ys[:]
-            y_train.pop(i)
+def _run_task(task):
+    X, y, decoder = executors.shared['X'], executors.shared['y'], executors.shared['decoder']
+    scheme, session, fold, train, test = task
 
-            X_train, y_train = concat_bins(X_train, y_train)
+    # a copy per task, so the confusion counts and kept models of concurrent tasks stay apart
+    decoder = copy.copy(decoder)
+    decoder.confusion, decoder.models, decoder.selected_alphas, decoder.interpolated = None, [], [], []
+    with profiling.stage('task', scheme = scheme, session = session, fold = fold):
+        acc = decoder.index_decoding(X, y, train, test, rng = task_rng(scheme, session, fold))
 
-            acc = decoder.train_test_decoding(X_train, y_train, X_test, y_test)
-            print(f'Accuracy for session {session}, without bin {i}: {np.mean(acc)}')
-            accuracies[session].append(acc)
-    
-    return accuracies
-
-def train_test_split_prop(Xsesh, ysesh):
-    train_X = [[] for i in range(ncv)]
-    train_y = [[] for i in range(ncv)]
-
-    test_X = [[] for i in range(ncv)]
-    test_y = [[] for i in range(ncv)]
-
-    for s in range(len(Xsesh)):
-        for b in range(len(Xsesh[s])):
-            tmp_X = Xsesh[s][b].squeeze()
-            tmp_y = ysesh[s][b].squeeze()
-
-            idx = np.random.choice(np.arange(tmp_X.shape[1]), size = tmp_X.shape[1], replace = False)
-            split_idx = np.array_split(idx, ncv)
-            
-            for i, indices in enumerate(split_idx):
-                test_tmp_X = tmp_X[:, indices, :]
-                test_tmp_y = tmp_y[indices]
-                train_inds = np.setdiff1d(idx, indices)
-                train_tmp_X = tmp_X[:, train_inds, :]
-                train_tmp_y = tmp_y[train_inds]
-
-                # append to train and test
-                if b == 0:
-                    train_X[s].append(train_tmp_X)
-                    train_y[s].append(train_tmp_y)
-                    test_X[s].append(test_tmp_X)
-                    test_y[s].append(test_tmp_y)
-                else:
-                    train_X[s][i] = np.concatenate((train_X[s][i], train_tmp_X), axis = 1)
-                    train_y[s][i] = np.concatenate((train_y[s][i], train_tmp_y), axis = 0)
-                    test_X[s][i] = np.concatenate((test_X[s][i], test_tmp_X), axis = 1)
-                    test_y[s][i] = np.concatenate((test_y[s][i], test_tmp_y), axis = 0)
-    return train_X, train_y, test_X, test_y
-
-
-def run_proportional_batch(Xsesh, ysesh, decoder):
-    accuracies = [[] for i in range(ncv)]
-
-    train_X, train_y, test_X, test_y = train_test_split_prop(Xsesh, ysesh)
-    for session in range(len(train_X)):
-        for i in range(len(train_X[session])):
-            acc = decoder.train_test_decoding(train_X[session][i], train_y[session][i], test_X[session][i], test_y[session][i])
-            print(f'Accuracy for session {session}: {np.mean(acc)}')
-            accuracies[session].append(acc)
-        
-    return accuracies
+    return scheme, session, fold, acc, decoder.confusion, decoder.models
+
+
+def run_tasks(X, y, tasks, decoder, backend = backend, split = None):
+    """Runs (scheme, session, fold, train, test) tasks on the backing tensor X (T, N, C) with an executor backend.
+
+    backend is one of executors.backends ('serial', 'thread', 'process' or 'dask'). split (see resources.py) gives the
+    number of workers and their BLAS threads, by default resources.plan(len(tasks), threads_per_process).
+
+    Returns
+    -------
+    results : dict with for each scheme the accuracies (session, fold, ...) padded with nan, n_valid the number of
+        folds of each session, the confusion counts summed over all tasks (or None) and the kept models of each
+        session ordered by fold
+    """
+    tasks = list(tasks)
+    split = split or resources.plan(len(tasks), threads_per_process)
+    if split.n_processes == 1:
+        backend = 'serial'
+
+    with executors.Executor(backend, split, initializer = executors.share, initargs = ({'X': X, 'y': y, 'decoder': decoder}, )) as executor:
+        outputs, stats = executors.timed_map(executor, _run_task, tasks)
+    print(f'{stats["n_tasks"]} tasks on {stats["n_workers"]} {backend} workers in {stats["wall"]:.1f} s, efficiency {stats["efficiency"]:.2f}')
+
+    collected = {}
+    for scheme, session, fold, acc, confusion, models in outputs:
+        print(f'Accuracy for {scheme}, session {session}, fold {fold}: {np.mean(acc)}')
+        r = collected.setdefault(scheme, {'acc': {}, 'confusion': None, 'models': {}})
+        r['acc'][session, fold] = acc
+        if confusion is not None:
+            r['confusion'] = confusion if r['confusion'] is None else r['confusion'] + confusion
+        r['models'].setdefault(session, {})[fold] = models
+
+    results = {}
+    for scheme, r in collected.items():
+        sessions = sorted({session for session, _ in r['acc']})
+        n_valid = [1 + max(fold for s, fold in r['acc'] if s == session) for session in sessions]
+        shape = np.shape(next(iter(r['acc'].values())))
+
+        accuracies = np.full((len(sessions), max(n_valid)) + shape, np.nan)
+        for (session, fold), acc in r['acc'].items():
+            accuracies[sessions.index(session), fold] = acc
+
+        models = {session: [m for fold in sorted(folds) for m in folds[fold]] for session, folds in r['models'].items()}
+        results[scheme] = {'accuracies': accuracies, 'n_valid': n_valid, 'confusion': r['confusion'], 'models': models}
+
+    return results
+
+
+def accuracy_dims(get_tgm = get_tgm, alpha = alpha):
+    """Names of the axes of the (session, fold, ...) accuracies of run_tasks."""
+    dims = ['session', 'fold', 'train_time', 'test_time'] if get_tgm else ['session', 'fold', 'time']
+    if np.ndim(alpha) == 1: # grid of alphas of a RidgeClassifier
+        dims.insert(2, 'alpha')
+    return dims
+
+
+def run_proportional_batch(X, y, session, bins, decoder, **kwargs):
+    return run_tasks(X, y, within_tasks(session, bins, ['prop']), decoder, **kwargs)['prop']
+
+
+def run_decoding_leave_bin_out(X, y, session, bins, decoder, **kwargs):
+    return run_tasks(X, y, within_tasks(session, bins, ['lbo']), decoder, **kwargs)['lbo']
+
+
+def accuracy_deviation(decoder, method, args_64, args, seed = 0):
+    """Runs a decoding method of the decoder in float64 on args_64 and in the decoder's dtype on args, with the same random state.
+
+    args_64 holds the data as loaded in float64 and args the data as stored in the decoder's dtype, so the
+    deviation includes the rounding of the stored data as well as that of the computations. E.g.
+    accuracy_deviation(decoder, 'index_decoding', (X_64, y, train, test), (X, y, train, test))
+
+    Returns
+    -------
+    deviation : maximum absolute difference between the accuracies
+    acc_64, acc : accuracies in float64 and in decoder.dtype
+    """
+    dtype = decoder.dtype
+    accuracies = []
+    for dt, a in [(np.float64, args_64), (dtype, args)]:
+        decoder.dtype = dt
+        np.random.seed(seed)
+        accuracies.append(getattr(decoder, method)(*a))
+    decoder.dtype = dtype
+
+    acc_64, acc = accuracies
+    return np.max(np.abs(acc_64 - acc)), acc_64, acc
 
 if __name__ in '__main__':
-    Xbin, ybin, Xsesh, ysesh = prep_data()
-    del Xbin, ybin
+    if profile:
+        profiling.start(profile)
+    if save_models:
+        os.makedirs('./models', exist_ok = True)
+    # one backing tensor of all trials, the cross validation schemes only index into it
+    with profiling.stage('load'):
+        X, y, session, bins = cv_splits.stack_bins(*load_data(dtype = dtype, target = target))
+    # all stimuli, so the classes are numbered the same way in every session
+    labels = np.unique(y) if target == 'trigger' else None
     
-    decoder = decoder.Decoder(classification=classification, ncv = ncv, alpha = alpha, scale = True, model_type = model_type, get_tgm=get_tgm)
+    # lowest chance level of the sessions (same as plots.chance_level), so no region above chance is left unrefined
+    refine_threshold = min(manifest.chance_levels(manifest.load_manifest())) if adaptive_step and target == 'animacy' else None
+    decoder = decoder.Decoder(classification=classification, ncv = ncv, alpha = alpha, scale = True, model_type = model_type, get_tgm=get_tgm, solver = solver, dtype = dtype, adaptive_step = adaptive_step, refine_threshold = refine_threshold, window = window, pseudo_k = pseudo_k, labels = labels, get_confusion = target == 'trigger', keep_models = save_models)
 
-    accuracies = run_proportional_batch(Xsesh, ysesh, decoder)
-    np.save(f'./accuracies/accuracies_{model_type}_prop.npy', accuracies)
-    
-    accuracies = run_decoding_leave_bin_out(Xsesh, ysesh, decoder)
-    np.save(f'./accuracies/accuracies_{model_type}_lbo.npy', accuracies)
+    if dtype is not None:
+        _, train, test = next(cv_splits.proportional(session, bins, ncv))
+        # reference on the data as loaded, before it was cast to dtype
+        X_64 = cv_splits.stack_bins(*load_data(target = target))[0]
+        deviation, _, _ = accuracy_deviation(decoder, 'index_decoding', (X_64, y, train, test), (X, y, train, test))
+        del X_64
+        print(f'Maximum accuracy deviation of {np.dtype(dtype).name} from float64: {deviation:.4f}')
+        decoder.models = []
+
+    dims = accuracy_dims(get_tgm, alpha)
+    name = model_type if target == 'animacy' else f'{model_type}_{target}'
+
+    # the tasks of both schemes share one pool
+    results = run_tasks(X, y, within_tasks(session, bins), decoder)
+
+    for scheme, short in [('proportional', 'prop'), ('leave bin out', 'lbo')]:
+        r = results[short]
+        save_accuracies(f'./accuracies/accuracies_{name}_{short}.npy', r['accuracies'], dims, n_valid = r['n_valid'], model_type = model_type, alpha = alpha, dtype = np.dtype(dtype or float).name, adaptive_step = adaptive_step, window = window, pseudo_k = pseudo_k, target = target, scheme = scheme)
+
+        if r['confusion'] is not None:
+            # (time, true, predicted) counts summed over sessions and folds
+            with profiling.stage('save'):
+                np.save(f'./accuracies/confusion_{name}_{short}.npy', r['confusion'])
+
+        for s, models in r['models'].items():
+            if models:
+                decoder.models = models
+                decoder.save_bundle(f'./models/{name}_{short}_session{s}.npy', unit_scale = data_unit(dtype = dtype), session = int(s))
+
+    if profiling.enabled():
+        profiling.report(profiling.trace_path())
@@ -0,0 +1,136 @@
+"""
+Executor backends for the decoding jobs: serial, threads, processes or a Dask cluster.
+
+All backends are used the same way, Executor(backend, split).map(func, items), so a grid of jobs
+runs unchanged from a laptop (serial, thread, process) to a local Dask cluster, which stands in for
+multi-node execution, or the scheduler of a real cluster (address). The workers get their data once,
+through the initializer and the shared dict, instead of with every task; jobs read it from
+executors.shared. timed_map and measure_overhead report how much of the wall time goes to scheduling.
+"""
+
+import time
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import resources
+
+backends = ['serial', 'thread', 'process', 'dask']
+
+# data shared with the jobs of a worker, set by share
+shared = {}
+
+
+def share(data):
+    """Initializer storing data (dict) in executors.shared of the worker."""
+    shared.update(data)
+
+
+def _init_worker(threads, initializer, initargs):
+    resources.init_worker(threads)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+class Executor():
+    def __init__(self, backend = 'process', split = None, initializer = None, initargs = (), address = None):
+        """
+        Pool of split.n_processes workers (see resources.plan, by default one per core) whose BLAS threads are
+        limited to split.threads. initializer(*initargs) is run once in every worker.
+
+        backend : 'serial' runs the jobs in this process, 'thread' and 'process' use concurrent.futures and 'dask'
+            starts a dask.distributed LocalCluster of worker processes, or connects to the scheduler at address.
+        """
+        if backend not in backends:
+            raise ValueError(f'Unknown backend {backend}, use one of {backends}')
+
+        self.backend = backend
+        self.split = split or resources.plan(resources.available_cores())
+        self.n_workers = 1 if backend == 'serial' else self.split.n_processes
+        self._cluster = None
+        init = partial(_init_worker, self.split.threads, initializer, initargs)
+
+        if backend == 'serial':
+            if initializer is not None:
+                initializer(*initargs)
+            self._pool = None
+        elif backend == 'thread':
+            self._pool = ThreadPoolExecutor(self.n_workers, initializer = init)
+        elif backend == 'process':
+            self._pool = ProcessPoolExecutor(self.n_workers, initializer = init)
+        else:
+            from dask.distributed import Client, LocalCluster
+            if address is None:
+                self._cluster = LocalCluster(n_workers = self.n_workers, threads_per_worker = 1, processes = True)
+            self._pool = Client(address or self._cluster)
+            self._pool.register_worker_callbacks(init)
+            self.n_workers = len(self._pool.scheduler_info()['workers'])
+
+
+    def map(self, func, items):
+        """Results of func on every item, in the order of items."""
+        if self._pool is None:
+            return map(func, items)
+        if self.backend == 'dask':
+            futures = self._pool.map(func, list(items), pure = False)
+            return (future.result() for future in futures)
+        return self._pool.map(func, items)
+
+
+    def shutdown(self):
+        if self.backend == 'dask':
+            self._pool.close()
+            if self._cluster is not None:
+                self._cluster.close()
+        elif self._pool is not None:
+            self._pool.shutdown()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+
+def _timed(func, item):
+    st = time.perf_counter()
+    result = func(item)
+    return result, time.perf_counter() - st
+
+
+def timed_map(executor, func, items):
+    """Maps func over items like executor.map and measures the scheduling overhead.
+
+    Returns
+    -------
+    results : list of the results in the order of items
+    stats : dict with the wall time, the summed time of the tasks in the workers (busy), the overhead per task,
+        (wall x workers - busy) / tasks, which includes idle workers at the end of the run, and the efficiency
+        busy / (wall x workers)
+    """
+    items = list(items)
+    st = time.perf_counter()
+    results, busy = [], 0.
+    for result, duration in executor.map(partial(_timed, func), items):
+        results.append(result)
+        busy += duration
+    wall = time.perf_counter() - st
+
+    capacity = wall * executor.n_workers
+    stats = {'backend': executor.backend, 'n_workers': executor.n_workers, 'n_tasks': len(items), 'wall': wall, 'busy': busy,
+             'overhead_per_task': (capacity - busy) / max(1, len(items)), 'efficiency': busy / capacity if capacity > 0 else 1.}
+
+    return results, stats
+
+
+def _noop(item):
+    return item
+
+
+def measure_overhead(executor, n_tasks = 200):
+    """Wall time per task (s) of n_tasks empty tasks, the cost of scheduling a task and returning its result."""
+    st = time.perf_counter()
+    for _ in executor.map(_noop, range(n_tasks)):
+        pass
+
+    return (time.perf_counter() - st) / n_tasks
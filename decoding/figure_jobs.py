@@ -0,0 +1,179 @@
+"""
+Batch rendering of figures on a process pool.
+
+Each figure is declared as a FigureJob with the plotting function, its arguments and the
+files it is made from. Arrays are passed as ArrayRefs, which the workers open memory-mapped,
+so the accuracy arrays are shared through the page cache instead of being pickled to every
+process. Figures whose inputs, arguments and plotting function have not changed since the last
+render are skipped.
+"""
+
+import os
+import json
+import time
+import hashlib
+import inspect
+import multiprocessing as mp
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import profiling
+
+cache_file = '.figure_cache.json'
+
+
+class ArrayRef(namedtuple('ArrayRef', ['path', 'index', 'squeeze'])):
+    """Reference to (a slice of) an array saved in a .npy or .npz file, resolved lazily in the worker.
+
+    For .npy files index is used to slice the memory-mapped array, for .npz files it is the key
+    (if index is None the whole npz file is passed on).
+    """
+    def __new__(cls, path, index = None, squeeze = False):
+        return super().__new__(cls, path, index, squeeze)
+
+    def load(self):
+        X = _open(self.path)
+        if self.path.endswith('.npz'):
+            if self.index is None:
+                return X
+            X = X[self.index]
+        elif self.index is not None:
+            X = X[self.index]
+        if self.squeeze:
+            X = X.squeeze()
+        return X
+
+
+class FigureJob(namedtuple('FigureJob', ['func', 'savepath', 'args', 'kwargs', 'inputs'])):
+    """A figure to render: func(*args, savepath = savepath, **kwargs).
+
+    inputs are extra files the figure depends on besides the ones referenced by ArrayRefs.
+    """
+    def __new__(cls, func, savepath, args = (), kwargs = None, inputs = ()):
+        return super().__new__(cls, func, savepath, tuple(args), kwargs or {}, tuple(inputs))
+
+
+# arrays opened by this process, so each file is only mapped once per worker
+_opened = {}
+
+def _open(path):
+    if path not in _opened:
+        if path.endswith('.npz'):
+            _opened[path] = np.load(path)
+        else:
+            try:
+                _opened[path] = np.load(path, mmap_mode = 'r')
+            except ValueError: # object arrays cannot be memory-mapped
+                _opened[path] = np.load(path, allow_pickle = True)
+    return _opened[path]
+
+
+def _resolve(value):
+    if isinstance(value, ArrayRef):
+        return value.load()
+    if isinstance(value, dict):
+        return {k: _resolve(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)) and not hasattr(value, '_fields'):
+        return type(value)(_resolve(v) for v in value)
+    return value
+
+
+def _input_files(job):
+    files = list(job.inputs)
+    def collect(value):
+        if isinstance(value, ArrayRef):
+            files.append(value.path)
+        elif isinstance(value, dict):
+            for v in value.values():
+                collect(v)
+        elif isinstance(value, (list, tuple)):
+            for v in value:
+                collect(v)
+    collect(job.args)
+    collect(job.kwargs)
+    return sorted(set(files))
+
+
+def job_digest(job):
+    """Hash of the plotting function and its source, its arguments and the size and modification time of the inputs,
+    so a figure is rendered again after its plotting function is edited."""
+    inputs = []
+    for path in _input_files(job):
+        st = os.stat(path)
+        inputs.append((path, st.st_size, st.st_mtime_ns))
+
+    try:
+        source = inspect.getsource(job.func)
+    except (OSError, TypeError):
+        # builtins and functions defined interactively have no source, they are hashed by name only
+        source = None
+
+    description = repr((job.func.__module__, job.func.__name__, source, job.args, sorted(job.kwargs.items()), inputs))
+    return hashlib.sha1(description.encode()).hexdigest()
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _render(job):
+    st = time.time()
+    with profiling.stage('plot', figure = job.savepath):
+        job.func(*_resolve(job.args), savepath = job.savepath, **_resolve(job.kwargs))
+    return job.savepath, time.time() - st
+
+
+def render_jobs(jobs, n_jobs = None, cache_path = None, force = False):
+    """Renders the figures that are out of date on a pool of n_jobs processes.
+
+    Parameters
+    ----------
+    jobs : list of FigureJob
+    n_jobs : int, optional
+        Number of processes, defaults to the number of cores (1 renders in this process).
+    cache_path : str, optional
+        JSON file with the digests of the rendered figures. Defaults to .figure_cache.json next to the first figure.
+    force : bool
+        Render all figures, even if they are up to date.
+
+    Returns
+    -------
+    rendered : list of savepaths that were rendered
+    """
+    if cache_path is None:
+        cache_path = os.path.join(os.path.dirname(jobs[0].savepath) if jobs else '.', cache_file)
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        cache = {}
+
+    digests = {job.savepath: job_digest(job) for job in jobs}
+    todo = [job for job in jobs if force or not os.path.exists(job.savepath) or cache.get(job.savepath) != digests[job.savepath]]
+    print(f'Rendering {len(todo)} of {len(jobs)} figures ({len(jobs) - len(todo)} up to date)')
+
+    if n_jobs is None:
+        n_jobs = mp.cpu_count()
+    n_jobs = max(1, min(n_jobs, len(todo)))
+
+    rendered = []
+    if n_jobs == 1:
+        _init_worker()
+        results = map(_render, todo)
+    else:
+        pool = ProcessPoolExecutor(n_jobs, initializer = _init_worker)
+        results = pool.map(_render, todo)
+
+    for savepath, duration in results:
+        print(f'{savepath} done in {duration:.1f} s')
+        cache[savepath] = digests[savepath]
+        rendered.append(savepath)
+
+    if n_jobs > 1:
+        pool.shutdown()
+
+    with open(cache_path, 'w') as f:
+        json.dump(cache, f, indent = 4)
+
+    return rendered
@@ -0,0 +1,686 @@
+"""
+Linear classifiers fitted for all time points at once with NumPy.
+
+The models are equivalent to make_pipeline(StandardScaler(), model) fitted separately on every
+time point, but the standardisation is folded into the weights so that a model trained on one
+time point can be scored on all testing time points with a single matrix product.
+
+Shapes: X is (T, N, C) (time, trials, channels), coef is (T, C, K) and intercept (T, K), where
+K = 1 for two classes and the number of classes otherwise.
+
+The large matrix products are done in the dtype of X (e.g. float32), while means, variances and the
+small (C, C) decompositions are accumulated in float64.
+"""
+
+import numpy as np
+
+
+def as_dtype(X, dtype, unit = 1.):
+    """Casts X to dtype, multiplying by unit in the new dtype (e.g. 1e15 to get sensor data in fT instead of T)."""
+    if dtype is None:
+        return X
+    if unit == 1.:
+        return X.astype(dtype, copy = False)
+
+    return np.multiply(X, unit, dtype = dtype)
+
+
+def scaler_params(X):
+    """Mean and scale of a StandardScaler fitted on each time point of X (T, N, C), accumulated in float64."""
+    mean = np.mean(X, axis = 1, dtype = np.float64)
+    scale = np.sqrt(np.mean((X - mean[:, None, :].astype(X.dtype))**2, axis = 1, dtype = np.float64))
+    scale[scale == 0] = 1
+
+    return mean, scale
+
+
+def standardize(X, mean, scale):
+    """Standardises X (T, N, C) in its own dtype."""
+    return (X - mean[:, None, :].astype(X.dtype)) / scale[:, None, :].astype(X.dtype)
+
+
+def window_view(X, window):
+    """Zero-copy view (T - window + 1, N, C, window) of the windows of window adjacent samples of X (T, N, C).
+
+    Reshaping a window to (N, C * window) gives the temporal embedding features, with feature c * window + i
+    the sample t + i of channel c.
+    """
+    return np.lib.stride_tricks.sliding_window_view(X, window, axis = 0)
+
+
+def window_features(X, window):
+    """Temporal embedding features (T - window + 1, N, C * window) of X (T, N, C), a copy for window > 1."""
+    if window == 1:
+        return X
+    T, N, C = X.shape
+    return window_view(X, window).reshape(T - window + 1, N, C * window)
+
+
+def unscale(coef, intercept, mean, scale):
+    """Folds the standardisation into the weights, so they can be applied to unscaled data.
+
+    coef : (..., T, C, K), intercept : (..., T, K), mean and scale : (T, C)
+    """
+    coef = coef / scale[..., None]
+    intercept = intercept - np.sum(mean[..., None] * coef, axis = -2)
+
+    return coef, intercept
+
+
+def binarize(y, classes):
+    """Targets of a ridge classifier: +1 for the class and -1 otherwise, a single column for two classes."""
+    Y = np.where(y[:, None] == classes[None, :], 1., -1.)
+    if len(classes) == 2:
+        Y = Y[:, 1:]
+
+    return Y
+
+
+def predict(decision, classes):
+    """Predicted classes from decision values (..., K)."""
+    if decision.shape[-1] == 1:
+        return classes[(decision[..., 0] > 0).astype(int)]
+
+    return classes[np.argmax(decision, axis = -1)]
+
+
+def confusion_counts(y_true, y_pred, labels):
+    """Counts (..., L, L) of the true (rows) against the predicted labels (columns), y_pred is (..., N)."""
+    L = len(labels)
+    idx = np.searchsorted(labels, y_true) * L + np.searchsorted(labels, y_pred)
+    rows = idx.reshape(-1, idx.shape[-1])
+    # one bincount for all leading indices
+    counts = np.bincount((rows + np.arange(len(rows))[:, None] * L * L).ravel(), minlength = len(rows) * L * L)
+
+    return counts.reshape(idx.shape[:-1] + (L, L))
+
+
+def score(coef, intercept, X_test, y_test, classes, get_tgm = True, window = 1, labels = None):
+    """Accuracy of the per time point models on X_test.
+
+    With window > 1 the models use the temporal embedding features (see window_view), the decision
+    values are summed over the samples of the window so the windows of X_test are never copied.
+
+    Parameters
+    ----------
+    coef : (T, C, K) weights applying to unscaled data
+    intercept : (T, K)
+    X_test : (T, N, C)
+    y_test : (N, )
+    classes : class labels corresponding to the K decision values
+    get_tgm : bool
+        If True each model is scored on all time points of X_test.
+    window : int
+        Number of samples per window, coef is then (T - window + 1, C * window, K).
+    labels : array, optional
+        Sorted labels of all classes. If given the confusion matrices of the models tested on their own
+        time point are returned as well.
+
+    Returns
+    -------
+    scores : (T, T) with training time along the first axis, or (T, ) if get_tgm is False
+    confusion : (T, L, L) counts of true (rows) against predicted (columns) labels, only if labels is given
+    """
+    T, _, K = coef.shape
+    coef = coef.astype(X_test.dtype).reshape(T, -1, window, K)
+    intercept = intercept.astype(X_test.dtype)
+    T_test = X_test.shape[0] - window + 1
+
+    if not get_tgm:
+        decision = sum(np.matmul(X_test[i:i + T_test], coef[:, :, i]) for i in range(window)) + intercept[:, None, :]
+        pred = predict(decision, classes)
+        scores = np.mean(pred == y_test[None, :], axis = 1)
+        if labels is None:
+            return scores
+        return scores, confusion_counts(y_test, pred, labels)
+
+    scores = np.zeros((T, T_test))
+    pred_diagonal = np.zeros((T, len(y_test)), dtype = classes.dtype)
+    for t in range(T):
+        decision = sum(np.matmul(X_test[i:i + T_test], coef[t, :, i]) for i in range(window)) + intercept[t]
+        pred = predict(decision, classes)
+        scores[t] = np.mean(pred == y_test[None, :], axis = 1)
+        pred_diagonal[t] = pred[min(t, T_test - 1)]
+
+    if labels is None:
+        return scores
+    return scores, confusion_counts(y_test, pred_diagonal, labels)
+
+
+def tgm_buffer(T_train, T_test, band = None, path = None):
+    """Zeroed (T_train, T_test) float array to accumulate a temporal generalisation matrix in.
+
+    If path is given the array is a memory-mapped .npy file, so TGMs of long epochs at high sampling
+    rates do not have to fit in memory. With band = k the cells with |t_train - t_test| > k are nan.
+    """
+    if path is None:
+        out = np.zeros((T_train, T_test))
+    else:
+        out = np.lib.format.open_memmap(path, mode = 'w+', dtype = np.float64, shape = (T_train, T_test))
+
+    if band is not None:
+        for t in range(T_train):
+            out[t, :max(0, t - band)] = np.nan
+            out[t, t + band + 1:] = np.nan
+
+    return out
+
+
+def score_tiles(coef, intercept, X_test, y_test, classes, out, weight = 1., tile_size = 100, band = None):
+    """Adds weight times the accuracy of the per time point models to out, one (tile_size, tile_size) tile at a time.
+
+    The decision values of a tile are (tile_size, tile_size, N, K), so the memory use does not depend on the
+    number of time points. With band = k only the tiles touching |t_train - t_test| <= k are evaluated.
+
+    Parameters
+    ----------
+    coef, intercept, X_test, y_test, classes : see score
+    out : (T_train, T_test) array or memmap, see tgm_buffer
+    weight : float
+        E.g. 1 / ncv to average over folds.
+    tile_size : int
+    band : int, optional
+
+    Returns
+    -------
+    out
+    """
+    T_train, T_test = out.shape
+    coef = coef.astype(X_test.dtype)
+    intercept = intercept.astype(X_test.dtype)
+
+    for t0 in range(0, T_train, tile_size):
+        t1 = min(t0 + tile_size, T_train)
+        if band is None:
+            u_start, u_stop = 0, T_test
+        else:
+            u_start, u_stop = max(0, t0 - band), min(T_test, t1 + band)
+
+        for u0 in range(u_start, u_stop, tile_size):
+            u1 = min(u0 + tile_size, u_stop)
+            decision = np.matmul(X_test[None, u0:u1], coef[t0:t1, None]) + intercept[t0:t1, None, None, :] # (t, u, N, K)
+            acc = np.mean(predict(decision, classes) == y_test, axis = -1)
+            if band is not None:
+                acc = np.where(np.abs(np.arange(t0, t1)[:, None] - np.arange(u0, u1)[None, :]) <= band, acc, 0)
+            out[t0:t1, u0:u1] += weight * acc
+
+    return out
+
+
+def coarse_index(n, step):
+    """Every step-th index of an axis of length n, including the last one."""
+    return np.unique(np.append(np.arange(0, n, step), n - 1))
+
+
+def adaptive_tgm(fitted, step, threshold):
+    """Coarse-to-fine TGM averaged over folds.
+
+    The TGM is first evaluated on every step-th training and testing time. The blocks between
+    neighbouring coarse points are evaluated at full resolution if any of their corners has an accuracy
+    above threshold, the remaining cells are interpolated bilinearly from the coarse grid.
+
+    Parameters
+    ----------
+    fitted : list of (coef, intercept, classes, X_test, y_test), one per fold
+    step : int
+    threshold : float
+        Accuracy above which a region is refined, e.g. the binomial chance level.
+
+    Returns
+    -------
+    tgm : (T_train, T_test) accuracies
+    interpolated : (T_train, T_test) bool, True for the cells that were interpolated
+    """
+    T_train = fitted[0][0].shape[0]
+    T_test = fitted[0][3].shape[0]
+
+    def evaluate(t, u):
+        acc = 0
+        for coef, intercept, classes, X_test, y_test in fitted:
+            decision = np.matmul(X_test[u], coef[t].astype(X_test.dtype)) + intercept[t].astype(X_test.dtype)
+            acc = acc + np.mean(predict(decision, classes) == y_test, axis = -1)
+        return acc / len(fitted)
+
+    tgm = np.zeros((T_train, T_test))
+    exact = np.zeros((T_train, T_test), dtype = bool)
+
+    rows, cols = coarse_index(T_train, step), coarse_index(T_test, step)
+    for t in rows:
+        tgm[t, cols] = evaluate(t, cols)
+        exact[t, cols] = True
+    coarse = tgm[np.ix_(rows, cols)]
+
+    # a block is refined if any of its corners is above the threshold
+    above = coarse > threshold
+    refine = np.zeros((T_train, T_test), dtype = bool)
+    if len(rows) > 1 and len(cols) > 1:
+        blocks = above[:-1, :-1] | above[1:, :-1] | above[:-1, 1:] | above[1:, 1:]
+        for i, j in zip(*np.nonzero(blocks)):
+            refine[rows[i]:rows[i+1] + 1, cols[j]:cols[j+1] + 1] = True
+    refine &= ~exact
+
+    for t in np.nonzero(refine.any(axis = 1))[0]:
+        u = np.nonzero(refine[t])[0]
+        tgm[t, u] = evaluate(t, u)
+        exact[t, u] = True
+
+    # bilinear interpolation of the coarse grid for the rest
+    along_test = np.array([np.interp(np.arange(T_test), cols, c) for c in coarse]) # (n_rows, T_test)
+    interpolated = np.array([np.interp(np.arange(T_train), rows, along_test[:, u]) for u in range(T_test)]).T
+    tgm[~exact] = interpolated[~exact]
+
+    return tgm, ~exact
+
+
+def ridge_path(X, y, alphas):
+    """Ridge classifiers for a grid of alphas from one eigendecomposition per time point.
+
+    Equivalent to make_pipeline(StandardScaler(), RidgeClassifier(alpha = alpha)) on every time point:
+    with the eigendecomposition Xs'Xs = V diag(lam) V', w(alpha) = V diag(1/(lam + alpha)) V' Xs'Y.
+
+    Parameters
+    ----------
+    X : (T, N, C) training data
+    y : (N, ) labels
+    alphas : (A, ) regularisation strengths
+
+    Returns
+    -------
+    coef : (A, T, C, K) weights applying to unscaled data
+    intercept : (A, T, K)
+    classes : (K, ) or (2, ) class labels
+    """
+    alphas = np.atleast_1d(np.asarray(alphas, dtype = float))
+    classes = np.unique(y)
+    Y = binarize(y, classes)
+
+    mean, scale = scaler_params(X)
+    Xs = standardize(X, mean, scale)
+
+    gram = np.matmul(Xs.transpose(0, 2, 1), Xs).astype(np.float64) # (T, C, C)
+    lam, V = np.linalg.eigh(gram)
+    lam = np.clip(lam, 0, None)
+
+    y_mean = np.mean(Y, axis = 0)
+    XtY = np.matmul(Xs.transpose(0, 2, 1), (Y - y_mean).astype(X.dtype)).astype(np.float64)
+    proj = np.matmul(V.transpose(0, 2, 1), XtY) # V'Xs'Y, (T, C, K)
+
+    coef = np.matmul(V[None], proj[None] / (lam[None, :, :, None] + alphas[:, None, None, None])) # (A, T, C, K)
+    intercept = np.broadcast_to(y_mean, coef.shape[:2] + (Y.shape[1], ))
+
+    coef, intercept = unscale(coef, intercept, mean, scale)
+
+    return coef, intercept, classes
+
+
+def ridge_scores(X_train, y_train, X_test, y_test, alphas, get_tgm = True):
+    """Scores of ridge classifiers trained on every time point, for one or more alphas.
+
+    Returns (T, T) scores (or (T, ) if get_tgm is False) for a single alpha and (A, T, T) (or (A, T)) for a grid.
+    """
+    coef, intercept, classes = ridge_path(X_train, y_train, alphas)
+    A, T, C, K = coef.shape
+
+    # all alphas are scored with the same matrix products by stacking their decision values
+    coef_stacked = coef.transpose(1, 2, 0, 3).reshape(T, C, A * K).astype(X_test.dtype)
+    intercept_stacked = intercept.transpose(1, 0, 2).reshape(T, A * K).astype(X_test.dtype)
+
+    if get_tgm:
+        scores = np.zeros((A, T, T))
+        for t in range(T):
+            decision = (np.matmul(X_test, coef_stacked[t]) + intercept_stacked[t]).reshape(T, -1, A, K)
+            scores[:, t] = np.mean(predict(decision, classes) == y_test[None, :, None], axis = 1).T
+    else:
+        decision = (np.matmul(X_test, coef_stacked) + intercept_stacked[:, None, :]).reshape(T, -1, A, K)
+        scores = np.mean(predict(decision, classes) == y_test[None, :, None], axis = 1).T
+
+    if np.ndim(alphas) == 0:
+        return scores[0]
+
+    return scores
+
+
+def class_moments(X, y, classes):
+    """Sufficient statistics of LDA for a set of trials: class counts, class sums and the scatter matrix of all trials.
+
+    X : (..., N, C), returns n (K, ), sums (..., K, C) and scatter (..., C, C) = sum_n x_n x_n'. The within-class
+    covariance only needs the pooled scatter matrix (see lda_covariance), so no matrix is built per class.
+    """
+    onehot = (y[:, None] == classes[None, :]).astype(X.dtype)
+    n = onehot.sum(axis = 0)
+    sums = np.matmul(onehot.T, X)
+    scatter = np.matmul(np.swapaxes(X, -1, -2), X)
+
+    return n, sums, scatter
+
+
+def window_moments(X, y, classes, window):
+    """Class counts, class sums and scatter matrices of the temporal embedding features of X (T, N, C).
+
+    The scatter matrix of a window consists of the lagged cross-products sum_n x_t x_{t+lag}', which are
+    computed once per time point and lag and shared by all overlapping windows: window products of
+    size (C, C) per time point instead of window**2.
+
+    Returns n (K, ), sums (T - window + 1, K, C * window) and scatter (T - window + 1, C * window, C * window)
+    """
+    T, N, C = X.shape
+    T_w = T - window + 1
+    onehot = (y[:, None] == classes[None, :]).astype(X.dtype)
+    n = onehot.sum(axis = 0)
+    K = len(classes)
+
+    sums_t = np.matmul(onehot.T, X) # (T, K, C)
+    Xt = np.swapaxes(X, -1, -2)
+    lagged = [np.matmul(Xt[:T - lag], X[lag:]) for lag in range(window)]
+
+    # every block is filled below
+    sums = np.empty((T_w, K, C, window), dtype = X.dtype)
+    scatter = np.empty((T_w, C, window, C, window), dtype = X.dtype)
+    for i in range(window):
+        sums[..., i] = sums_t[i:i + T_w]
+        for j in range(i, window):
+            block = lagged[j - i][i:i + T_w] # sum_n x_{t+i} x_{t+j}'
+            scatter[:, :, i, :, j] = block
+            scatter[:, :, j, :, i] = np.swapaxes(block, -1, -2)
+
+    return n, sums.reshape(T_w, K, C * window), scatter.reshape(T_w, C * window, C * window)
+
+
+def lda_covariance(n, sums, scatter):
+    """Standardisation and pooled within-class covariance from sufficient statistics.
+
+    The standardisation is the one a StandardScaler fitted on the same trials would apply, and the
+    within-class covariance is the prior-weighted average of the empirical class covariances of the
+    standardised data, as in LinearDiscriminantAnalysis(solver = 'lsqr'), which is
+    scatter / n - sum_k priors_k m_k m_k' for the scatter matrix of all trials and the class means m_k.
+    Leading axes (e.g. folds or time points) are broadcast.
+
+    Returns
+    -------
+    cov : dict with mean and scale of the scaler (..., C), standardised class means (..., K, C), priors (..., K),
+        the within-class covariance within (..., C, C) and its average variance mu (...)
+    """
+    n = np.asarray(n, dtype = float)
+    C = sums.shape[-1]
+    n_total = n.sum(axis = -1)
+
+    mean = sums.sum(axis = -2) / n_total[..., None]
+    var = np.einsum('...cc->...c', scatter) / n_total[..., None] - mean**2
+    scale = np.sqrt(np.clip(var, 0, None))
+    scale[scale == 0] = 1
+
+    means = sums / n[..., :, None]
+    priors = n / n_total[..., None]
+    within = scatter / n_total[..., None, None]
+    within -= np.matmul(np.swapaxes(priors[..., :, None] * means, -1, -2), means)
+
+    within /= scale[..., :, None] * scale[..., None, :]
+    means = (means - mean[..., None, :]) / scale[..., None, :]
+
+    return {'mean': mean, 'scale': scale, 'means': means, 'priors': priors, 'within': within, 'mu': np.trace(within, axis1 = -2, axis2 = -1) / C}
+
+
+def lda_path_from_moments(n, sums, scatter):
+    """lda_covariance with the eigendecomposition of the within-class covariance, for the weights of many shrinkage values.
+
+    Returns
+    -------
+    path : dict with mean and scale of the scaler (..., C), standardised class means (..., K, C), priors (..., K),
+        eigenvalues lam (..., C) and eigenvectors U (..., C, C) of the within-class covariance and its average variance mu (...)
+    """
+    path = lda_covariance(n, sums, scatter)
+    path['lam'], path['U'] = np.linalg.eigh(path.pop('within'))
+
+    return path
+
+
+def lda_path_coef(path, shrinkage):
+    """LDA weights on standardised data for one or more shrinkage values (first axis of the result).
+
+    With the within-class covariance S = U diag(lam) U', the shrunk covariance (1 - a) S + a mu I has
+    eigenvalues (1 - a) lam + a mu, so the weights for every shrinkage follow from one eigendecomposition.
+
+    Returns
+    -------
+    proj : (A, ..., K, C) weights in the eigenbasis (coef = proj @ U')
+    intercept : (A, ..., K)
+    """
+    shrinkage = np.atleast_1d(np.asarray(shrinkage, dtype = float))
+    shrinkage = shrinkage.reshape(shrinkage.shape + (1, ) * (path['lam'].ndim - shrinkage.ndim + 1))
+    d = (1 - shrinkage) * path['lam'] + shrinkage * path['mu'][..., None]
+
+    # pseudo-inverse for (near) singular covariances, as lstsq does
+    tol = np.max(np.abs(d), axis = -1, keepdims = True) * d.shape[-1] * np.finfo(float).eps
+    d_inv = np.where(np.abs(d) > tol, 1 / np.where(d == 0, 1, d), 0)
+
+    means_U = np.matmul(path['means'], path['U']) # (..., K, C)
+    proj = means_U * d_inv[..., None, :]
+    intercept = -0.5 * np.sum(means_U * proj, axis = -1) + np.log(path['priors'])
+
+    return proj, intercept
+
+
+def _class_weights(coef, intercept, path):
+    """Weights (..., C, K) and intercepts (..., K) applying to unscaled data from the weights (..., K, C) of every
+    class on standardised data, K = 1 for two classes."""
+    if coef.shape[-2] == 2:
+        coef = coef[..., 1:, :] - coef[..., :1, :]
+        intercept = intercept[..., 1:] - intercept[..., :1]
+
+    return unscale(np.swapaxes(coef, -1, -2), intercept, path['mean'], path['scale'])
+
+
+def lda_coef(path, shrinkage):
+    """Weights (..., C, K) and intercepts (..., K) applying to unscaled data, K = 1 for two classes."""
+    proj, intercept = lda_path_coef(path, shrinkage)
+    coef = np.matmul(proj, np.swapaxes(path['U'], -1, -2))[0] # (..., K, C)
+
+    return _class_weights(coef, intercept[0], path)
+
+
+def lda_weights(cov, shrinkage):
+    """Weights (..., C, K) and intercepts (..., K) applying to unscaled data from lda_covariance, for one shrinkage
+    or one per leading index (e.g. per time point).
+
+    A positive shrinkage makes the shrunk covariance positive definite, so the weights are solved for directly,
+    which is several times cheaper than the eigendecomposition lda_coef needs for the pseudo-inverse of a
+    singular covariance.
+    """
+    shrinkage = np.asarray(0 if shrinkage is None else shrinkage, dtype = float)
+    if np.all(shrinkage > 0):
+        a = shrinkage[..., None, None]
+        within = (1 - a) * cov['within']
+        C = within.shape[-1]
+        within[..., np.arange(C), np.arange(C)] += (shrinkage * cov['mu'])[..., None]
+        coef = np.swapaxes(np.linalg.solve(within, np.swapaxes(cov['means'], -1, -2)), -1, -2) # (..., K, C)
+        intercept = -0.5 * np.sum(cov['means'] * coef, axis = -1) + np.log(cov['priors'])
+        return _class_weights(coef, intercept, cov)
+
+    path = dict(cov)
+    path['lam'], path['U'] = np.linalg.eigh(path.pop('within'))
+    if shrinkage.ndim == 0 or np.all(shrinkage == shrinkage.flat[0]):
+        return lda_coef(path, shrinkage.flat[0])
+
+    weights = [lda_coef({key: value[i] for key, value in path.items()}, a) for i, a in enumerate(shrinkage)]
+    return np.array([w[0] for w in weights]), np.array([w[1] for w in weights])
+
+
+def lda_fit(X, y, shrinkage, chunk_size = 25, window = 1, return_shrinkage = False):
+    """LDA (lsqr solver) on every time point, equivalent to make_pipeline(StandardScaler(), LDA(solver = 'lsqr', shrinkage = shrinkage)).
+
+    With window > 1 the models are fitted on the temporal embedding features of window adjacent samples
+    (see window_view), using the scatter matrices from window_moments. With shrinkage = 'auto' the windows of
+    one chunk of time points are copied for the Ledoit-Wolf estimate.
+
+    Parameters
+    ----------
+    X : (T, N, C) training data
+    y : (N, ) labels
+    shrinkage : 'auto' (Ledoit-Wolf), None, float or (T, ) array with the shrinkage of each time point
+    chunk_size : int
+        Number of time points whose scatter matrices are held in memory at once.
+    window : int
+        Number of adjacent samples per window.
+    return_shrinkage : bool
+        Also return the shrinkage of every time point, (T - window + 1, ) or for 'auto' the Ledoit-Wolf
+        intensity of every class (T - window + 1, n_classes).
+
+    Returns
+    -------
+    coef : (T - window + 1, C * window, K) weights applying to unscaled data, intercept : (T - window + 1, K), classes
+        and with return_shrinkage the shrinkage
+    """
+    T, N, C = X.shape
+    T, C = T - window + 1, C * window
+    classes = np.unique(y)
+
+    K = 1 if len(classes) == 2 else len(classes)
+    coef = np.zeros((T, C, K))
+    intercept = np.zeros((T, K))
+
+    if isinstance(shrinkage, str) and shrinkage == 'auto':
+        shrinkage = np.zeros((T, len(classes)))
+        for start in range(0, T, chunk_size):
+            sl = slice(start, start + chunk_size)
+            coef[sl], intercept[sl], shrinkage[sl] = _lda_auto(window_features(X[start:start + chunk_size + window - 1], window), y, classes)
+        return (coef, intercept, classes, shrinkage) if return_shrinkage else (coef, intercept, classes)
+
+    shrinkage = np.broadcast_to(np.asarray(0 if shrinkage is None else shrinkage, dtype = float), (T, ))
+
+    for start in range(0, T, chunk_size):
+        sl = slice(start, start + chunk_size)
+        X_chunk = X[start:start + chunk_size + window - 1]
+        # centring first keeps the scatter matrices accurate in float32
+        shift = np.mean(X_chunk, axis = 1, dtype = np.float64)
+        X_chunk = X_chunk - shift[:, None, :].astype(X.dtype)
+        if window == 1:
+            n, sums, scatter = class_moments(X_chunk, y, classes)
+        else:
+            n, sums, scatter = window_moments(X_chunk, y, classes, window)
+            shift = window_view(shift, window).reshape(-1, C)
+        cov = lda_covariance(np.broadcast_to(n, sums.shape[:-1]), sums.astype(np.float64, copy = False), scatter.astype(np.float64, copy = False))
+        cov['mean'] = cov['mean'] + shift
+        coef[sl], intercept[sl] = lda_weights(cov, shrinkage[sl])
+
+    return (coef, intercept, classes, shrinkage) if return_shrinkage else (coef, intercept, classes)
+
+
+def ledoit_wolf_shrinkage(X, return_covariance = False):
+    """Ledoit-Wolf shrinkage intensity of a stack of datasets X (..., N, C), e.g. all time points (T, N, C) at once.
+
+    Gives the same values as sklearn.covariance.ledoit_wolf_shrinkage applied to each X[t], without the loop
+    over blocks. With return_covariance the empirical covariance (..., C, C) of X is returned as well.
+    """
+    N, C = X.shape[-2:]
+    X = X - np.mean(X, axis = -2, keepdims = True, dtype = np.float64).astype(X.dtype)
+    emp_cov = np.matmul(np.swapaxes(X, -1, -2), X).astype(np.float64) / N
+    beta_ = np.sum(np.sum(X**2, axis = -1, dtype = np.float64)**2, axis = -1)
+
+    emp_cov_trace = np.trace(emp_cov, axis1 = -2, axis2 = -1)
+    mu = emp_cov_trace / C
+    delta_ = np.sum(emp_cov**2, axis = (-2, -1))
+    beta = 1. / (C * N) * (beta_ / N - delta_)
+    delta = (delta_ - 2. * mu * emp_cov_trace + C * mu**2) / C
+    beta = np.minimum(beta, delta)
+    shrinkage = np.where(beta == 0, 0., beta / np.where(delta == 0, 1, delta))
+
+    return (shrinkage, emp_cov) if return_covariance else shrinkage
+
+
+def _lda_auto(X, y, classes):
+    """LDA with Ledoit-Wolf shrinkage ('auto') on a stack of time points X (T, N, C).
+
+    As in sklearn, every class is standardised, shrunk towards the identity with its own Ledoit-Wolf
+    intensity and rescaled, which gives (1 - a_k) S_k + a_k mu_k diag(S_k) for the class covariance S_k.
+
+    Returns coef (T, C, K), intercept (T, K) applying to unscaled data and the intensities a_k (T, n_classes).
+    """
+    mean, scale = scaler_params(X)
+    Xs = standardize(X, mean, scale)
+    C = X.shape[-1]
+
+    n = np.array([np.sum(y == c) for c in classes], dtype = float)
+    priors = n / n.sum()
+    means = np.zeros((X.shape[0], len(classes), C))
+    within = np.zeros((X.shape[0], C, C))
+    shrinkage = np.zeros((X.shape[0], len(classes)))
+
+    for k, c in enumerate(classes):
+        Xk = Xs[:, y == c, :]
+        means[:, k] = np.mean(Xk, axis = 1, dtype = np.float64)
+        Xk = Xk - means[:, k, None, :].astype(X.dtype)
+        sd = np.sqrt(np.mean(Xk**2, axis = 1, dtype = np.float64))
+        sd[sd == 0] = 1
+        Z = Xk / sd[:, None, :].astype(X.dtype)
+
+        shrinkage[:, k], corr = ledoit_wolf_shrinkage(Z, return_covariance = True)
+        mu = np.trace(corr, axis1 = -2, axis2 = -1) / C
+
+        corr = (1 - shrinkage[:, k])[:, None, None] * corr
+        corr[:, np.arange(C), np.arange(C)] += (shrinkage[:, k] * mu)[:, None]
+        within += priors[k] * sd[:, :, None] * corr * sd[:, None, :]
+
+    coef = np.linalg.solve(within, means.transpose(0, 2, 1)) # (T, C, K)
+    intercept = -0.5 * np.sum(means.transpose(0, 2, 1) * coef, axis = 1) + np.log(priors)
+
+    if len(classes) == 2:
+        coef = coef[:, :, 1:] - coef[:, :, :1]
+        intercept = intercept[:, 1:] - intercept[:, :1]
+
+    return unscale(coef, intercept, mean, scale) + (shrinkage, )
+
+
+def lda_nested_shrinkage(X, y, alpha_grid, ncv_inner = 5, chunk_size = 25, rng = np.random):
+    """Selects the LDA shrinkage of every time point by inner cross validation on the training data.
+
+    The class sums and scatter matrix of each inner fold are computed for a chunk of time points at once; the
+    training statistics of each inner fold are the totals minus the statistics of the held out fold, and the
+    whole shrinkage path is evaluated from one eigendecomposition per inner fold and time point (see lda_path_coef).
+
+    Parameters
+    ----------
+    X : (T, N, C) training data of the outer fold
+    y : (N, ) labels
+    alpha_grid : (A, ) shrinkage values in [0, 1]
+    ncv_inner : int
+        Number of inner folds.
+    chunk_size : int
+        Number of time points whose statistics are held in memory at once.
+    rng : np.random.Generator or the np.random module
+        Draws the inner folds.
+
+    Returns
+    -------
+    shrinkage : (T, ) shrinkage with the highest inner accuracy at each time point
+    inner_accuracy : (A, T) mean inner accuracy of each shrinkage value
+    """
+    alpha_grid = np.asarray(alpha_grid, dtype = float)
+    T, N, C = X.shape
+    classes = np.unique(y)
+
+    inds = rng.permutation(N)
+    folds = np.array_split(inds, ncv_inner)
+    inner_accuracy = np.zeros((len(alpha_grid), T))
+
+    for start in range(0, T, chunk_size):
+        sl = slice(start, start + chunk_size)
+        X_chunk = X[sl] - np.mean(X[sl], axis = 1, keepdims = True, dtype = np.float64).astype(X.dtype)
+        # statistics of each inner fold, the training statistics are the totals minus the held out fold
+        moments = [class_moments(X_chunk[:, f], y[f], classes) for f in folds]
+        n = np.array([m[0] for m in moments], dtype = np.float64) # (F, K)
+        sums = np.array([m[1] for m in moments], dtype = np.float64) # (F, T, K, C)
+        scatter = np.array([m[2] for m in moments], dtype = np.float64) # (F, T, C, C)
+
+        n_train = np.broadcast_to((n.sum(0) - n)[:, None], sums.shape[:-1])
+        path = lda_path_from_moments(n_train, sums.sum(0) - sums, scatter.sum(0) - scatter)
+        proj, intercept = lda_path_coef(path, alpha_grid) # (A, F, T, K, C), (A, F, T, K)
+
+        for i, f in enumerate(folds):
+            z = np.matmul((X_chunk[:, f] - path['mean'][i][:, None, :]) / path['scale'][i][:, None, :], path['U'][i]) # (T, n_val, C)
+            decision = np.matmul(z, np.swapaxes(proj[:, i], -1, -2)) + intercept[:, i, :, None, :] # (A, T, n_val, K)
+            pred = classes[np.argmax(decision, axis = -1)]
+            inner_accuracy[:, sl] += np.mean(pred == y[f], axis = -1) / len(folds)
+
+    shrinkage = alpha_grid[np.argmax(inner_accuracy, axis = 0)]
+
+    return shrinkage, inner_accuracy
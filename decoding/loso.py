@@ -0,0 +1,141 @@
+"""
+Leave-one-session-out decoding from streamed sufficient statistics.
+
+The LDA of a time point only depends on the class counts, class sums and the scatter matrix of the
+training trials (see linear_models.lda_covariance). They are accumulated per session in one pass over the
+bins, into memory-mapped .npy files, and the training statistics of each fold are the sums over the
+other sessions. The held out session is scored in a second pass over the bins, so no session is ever
+concatenated with another and memory stays O(T x C^2) however many sessions are pooled.
+
+Usage: python loso.py
+"""
+
+import os
+import shutil
+import time
+import numpy as np
+from decoding import iter_bins, label_path
+from accuracy_store import save_accuracies
+from linear_models import class_moments, lda_covariance, lda_weights, score
+
+sens = False
+alpha = 0.1 # shrinkage of the LDA, a float or None ('auto' needs the trials themselves)
+get_tgm = True
+chunk_size = 25 # time points whose scatter matrices are held in memory at once
+moments_dir = './loso_moments'
+
+
+def accumulate_moments(bins, classes, directory, chunk_size = chunk_size):
+    """Accumulates the class sums and the scatter matrix of every session over the bins.
+
+    bins yields (b, X, y, sessioninds) as decoding.iter_bins, X is (T, N, C). The class sums (T, K, C) and the
+    scatter matrix of all trials (T, C, C) of session s are saved in float64 to sums_{s}.npy and scatter_{s}.npy
+    in directory.
+
+    Returns
+    -------
+    n : dict with the class counts (K, ) of every session
+    shift : (T, C) value subtracted from all trials before accumulating (the mean of the first bin), which
+        keeps the scatter matrices accurate
+    """
+    os.makedirs(directory, exist_ok = True)
+    n, shift = {}, None
+
+    for _, X, y, sessioninds in bins:
+        if shift is None:
+            shift = np.mean(X, axis = 1, dtype = np.float64)
+        T, _, C = X.shape
+
+        for s in np.unique(sessioninds):
+            if s not in n:
+                n[s] = np.zeros(len(classes))
+                np.lib.format.open_memmap(f'{directory}/sums_{s}.npy', mode = 'w+', shape = (T, len(classes), C))
+                np.lib.format.open_memmap(f'{directory}/scatter_{s}.npy', mode = 'w+', shape = (T, C, C))
+            sums = np.load(f'{directory}/sums_{s}.npy', mmap_mode = 'r+')
+            scatter = np.load(f'{directory}/scatter_{s}.npy', mmap_mode = 'r+')
+
+            inds = sessioninds == s
+            for start in range(0, T, chunk_size):
+                X_chunk = X[start:start + chunk_size, inds] - shift[start:start + chunk_size, None, :].astype(X.dtype)
+                n_s, sums_s, scatter_s = class_moments(X_chunk, y[inds], classes)
+                sums[start:start + chunk_size] += sums_s
+                scatter[start:start + chunk_size] += scatter_s
+            n[s] += n_s
+
+            sums.flush()
+            scatter.flush()
+            del sums, scatter
+
+    return n, shift
+
+
+def loso_weights(n, directory, session, shift, classes, shrinkage = alpha, chunk_size = chunk_size):
+    """LDA weights of all time points trained on every session but session, from the accumulated statistics.
+
+    Returns coef (T, C, K), intercept (T, K) applying to unscaled data, and the classes present in the training sessions.
+    """
+    train = [s for s in n if s != session]
+    n_train = np.sum([n[s] for s in train], axis = 0)
+    present = n_train > 0 # classes missing from the training sessions are left out
+    moments = [(np.load(f'{directory}/sums_{s}.npy', mmap_mode = 'r'), np.load(f'{directory}/scatter_{s}.npy', mmap_mode = 'r')) for s in train]
+
+    T, C = shift.shape
+    K = 1 if np.sum(present) == 2 else np.sum(present)
+    coef = np.zeros((T, C, K))
+    intercept = np.zeros((T, K))
+
+    for start in range(0, T, chunk_size):
+        sl = slice(start, start + chunk_size)
+        # training statistics of the chunk summed over sessions, one session at a time
+        sums = sum(np.asarray(m[0][sl][:, present]) for m in moments)
+        scatter = sum(np.asarray(m[1][sl]) for m in moments)
+
+        cov = lda_covariance(np.broadcast_to(n_train[present], sums.shape[:-1]), sums, scatter)
+        cov['mean'] = cov['mean'] + shift[sl]
+        coef[sl], intercept[sl] = lda_weights(cov, shrinkage)
+
+    return coef, intercept, classes[present]
+
+
+def loso_scores(bins, weights, get_tgm = get_tgm):
+    """Accuracy of the models of every held out session, from a second pass over the bins.
+
+    weights : dict with (coef, intercept, classes) of every held out session (see loso_weights)
+
+    Returns a dict with the (T, T) accuracies (or (T, ) if get_tgm is False) of every session.
+    """
+    correct, n_trials = {}, {}
+    for _, X, y, sessioninds in bins:
+        for s in np.unique(sessioninds):
+            inds = sessioninds == s
+            # mean accuracy of the trials of the bin, weighted by their number
+            acc = score(*weights[s][:2], X[:, inds], y[inds], weights[s][2], get_tgm = get_tgm) * np.sum(inds)
+            correct[s] = correct.get(s, 0) + acc
+            n_trials[s] = n_trials.get(s, 0) + np.sum(inds)
+
+    return {s: correct[s] / n_trials[s] for s in correct}
+
+
+def run_loso(load_bins, classes, directory = moments_dir, shrinkage = alpha, get_tgm = get_tgm, chunk_size = chunk_size):
+    """Leave-one-session-out decoding, load_bins() returns a fresh iterator over the bins (e.g. decoding.iter_bins).
+
+    Returns the accuracies (n_sessions, T, T) (or (n_sessions, T)) ordered by session.
+    """
+    n, shift = accumulate_moments(load_bins(), classes, directory, chunk_size)
+    weights = {s: loso_weights(n, directory, s, shift, classes, shrinkage, chunk_size) for s in n}
+    accuracies = loso_scores(load_bins(), weights, get_tgm)
+
+    return np.array([accuracies[s] for s in sorted(accuracies)])
+
+
+if __name__ == '__main__':
+    st = time.time()
+    classes = np.unique(np.concatenate(np.load(label_path(), allow_pickle = True)))
+    directory = f'{moments_dir}/{"sens" if sens else "source"}'
+    shutil.rmtree(directory, ignore_errors = True)
+
+    accuracies = run_loso(lambda: iter_bins(sens = sens), classes, directory)
+    print(f'Time taken: {time.time() - st:.1f} s')
+
+    dims = ['session', 'train_time', 'test_time'] if get_tgm else ['session', 'time']
+    save_accuracies(f'./accuracies/loso_LDA_{"sens" if sens else "source"}.npy', accuracies, dims, alpha = alpha, scheme = 'leave one session out')
@@ -0,0 +1,112 @@
+"""
+Compact export of the fitted per time point decoders.
+
+A bundle is a float32 .npy file holding all arrays back to back, and a JSON header with the same
+name (.json) giving the shape and offset of every array, the classes, the original labels of the
+classes, the dtype and unit scaling of the training data and information about the run. The .npy file is memory-mapped when loading, so a bundle loads in milliseconds whatever
+its size, and it can be scored without scikit-learn.
+
+Arrays, for F folds, T time points, C features and K decision values (K = 1 for two classes):
+coef (F, T, C, K)           weights on standardised data
+intercept (F, T, K)
+mean, scale (F, T, C)       of the scaler fitted on the training data
+shrinkage (F, T)            regularisation of each model, for Ledoit-Wolf (alpha = 'auto') the intensity
+                            of every class (F, T, n_classes)
+covariance (F, T, C, C)     optional, covariance of the standardised training data, used for the
+                            activation patterns (Haufe et al., 2014) without refitting
+
+The arrays are in the units of the training data, which was multiplied by unit_scale when it was loaded
+(e.g. 1e15 for sensor data in fT); bundle_weights and haufe_patterns convert back to the recorded units.
+"""
+
+import json
+import numpy as np
+import profiling
+from linear_models import score
+
+fields = ['coef', 'intercept', 'mean', 'scale', 'shrinkage', 'covariance']
+
+
+def header_path(path):
+    return path[:-4] + '.json' if path.endswith('.npy') else path + '.json'
+
+
+@profiling.traced('save')
+def write_bundle(path, arrays, classes, labels = None, dtype = 'float64', unit_scale = 1., **info):
+    """Writes the arrays (dict with the fields above) to one float32 .npy file and its JSON header.
+
+    labels are the original values of the classes (the classes themselves by default), dtype and unit_scale
+    the dtype of the training data and the factor it was multiplied by when it was loaded.
+    """
+    labels = classes if labels is None else labels
+    header = {'fields': {}, 'classes': np.asarray(classes).tolist(), 'labels': np.asarray(labels).tolist(), 'dtype': np.dtype(dtype).name,
+              'unit_scale': float(unit_scale), 'info': info}
+    offset = 0
+    for name in fields:
+        if arrays.get(name) is None:
+            continue
+        shape = np.shape(arrays[name])
+        header['fields'][name] = {'offset': offset, 'shape': list(shape)}
+        offset += int(np.prod(shape))
+
+    flat = np.lib.format.open_memmap(path, mode = 'w+', dtype = np.float32, shape = (offset, ))
+    for name, field in header['fields'].items():
+        size = int(np.prod(field['shape']))
+        flat[field['offset']:field['offset'] + size] = np.ravel(arrays[name])
+    flat.flush()
+    del flat
+
+    with open(header_path(path), 'w') as f:
+        json.dump(header, f, indent = 4)
+
+
+def load_bundle(path):
+    """Loads a bundle as a dict of read-only memory-mapped views, plus its classes, labels, dtype, unit_scale and info."""
+    with open(header_path(path), 'r') as f:
+        header = json.load(f)
+    flat = np.load(path, mmap_mode = 'r')
+
+    bundle = {'classes': np.array(header['classes']), 'labels': np.array(header['labels']), 'dtype': np.dtype(header['dtype']),
+              'unit_scale': header['unit_scale'], 'info': header['info']}
+    for name, field in header['fields'].items():
+        size = int(np.prod(field['shape']))
+        bundle[name] = flat[field['offset']:field['offset'] + size].reshape(field['shape'])
+
+    return bundle
+
+
+def bundle_weights(bundle, fold):
+    """Weights (T, C, K) and intercepts (T, K) of one fold, applying to unscaled data in the recorded units."""
+    scale = np.asarray(bundle['scale'][fold], dtype = np.float64)
+    coef = np.asarray(bundle['coef'][fold], dtype = np.float64) / scale[..., None]
+    intercept = np.asarray(bundle['intercept'][fold], dtype = np.float64) - np.sum(np.asarray(bundle['mean'][fold])[..., None] * coef, axis = -2)
+
+    # x * unit_scale @ coef = x @ (coef * unit_scale)
+    return coef * bundle['unit_scale'], intercept
+
+
+def score_bundle(bundle, X_test, y_test, fold = None, get_tgm = True):
+    """Accuracy of the models of one fold (or the mean over all folds) on X_test (T, N, C) in the recorded units."""
+    folds = range(bundle['coef'].shape[0]) if fold is None else [fold]
+    window = bundle['info'].get('window', 1)
+    scores = [score(*bundle_weights(bundle, f), X_test, y_test, bundle['classes'], get_tgm = get_tgm, window = window) for f in folds]
+
+    return np.mean(scores, axis = 0)
+
+
+def haufe_patterns(bundle):
+    """Activation patterns (F, T, C, K) in the recorded units of the data, from the cached covariances.
+
+    With the covariance R of the standardised data and weights w on standardised data, the pattern is
+    R w (R_s)^-1 with R_s = w' R w the covariance of the decision values, scaled back to the data units.
+    """
+    if 'covariance' not in bundle:
+        raise ValueError('The bundle has no covariances, save it with keep_models = True and window = 1')
+
+    R = np.asarray(bundle['covariance'], dtype = np.float64)
+    W = np.asarray(bundle['coef'], dtype = np.float64)
+    RW = np.matmul(R, W) # (F, T, C, K)
+    cov_s = np.matmul(np.swapaxes(W, -1, -2), RW) # (F, T, K, K)
+    patterns = np.swapaxes(np.linalg.solve(cov_s, np.swapaxes(RW, -1, -2)), -1, -2)
+
+    return patterns * np.asarray(bundle['scale'])[..., None] / bundle['unit_scale']
@@ -1,15 +1,21 @@
 """
 Creates plots of the decoding results.
 
-Usage: python plots.py
+Usage: python plots.py [--n_jobs N_JOBS] [--force]
 """
 
+import argparse as ap
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy.stats import binom
-from decoding import prep_data
+import sys
+sys.path.append('../subset_data')
+import manifest
+from figure_jobs import ArrayRef, FigureJob, render_jobs
+from accuracy_store import ensure_numeric
+import profiling
 
 colours = ['#0063B2FF', '#5DBB63FF']
+sfreq = 250 # sampling frequency of the decoded data (Hz), the number of time points is taken from the arrays
 
 # set font for all plots
 plt.rcParams['font.family'] = 'times new roman'
@@ -26,20 +32,43 @@ plt.rcParams['figure.dpi'] = 300
 
 
 def chance_level(alpha = 0.001):
-    Xbin, ybin, Xsesh, ysesh = prep_data()
-    del Xbin, ybin, Xsesh
-    n_trials = [len(np.concatenate(i)) for i in ysesh]
-    chance_level = []
-    for i in range(len(n_trials)):
-        n, p = n_trials[i], 0.5
-        k = binom.ppf(1-alpha, n, p)
-        chance_level.append(k/n)
-    return chance_level
+    # trial counts are read from the data manifest instead of loading the trials
+    return manifest.chance_levels(manifest.load_manifest(), alpha = alpha)
+
+
+def time_ticks(n_times, step = None):
+    """Tick positions (samples) and labels (s) for a time axis of n_times samples."""
+    duration = n_times / sfreq
+    if step is None:
+        # at most about 6 ticks
+        step = next(st for st in [0.2, 0.5, 1., 2., 5., 10.] if duration / st <= 6) if duration <= 60 else duration / 5
+    positions = np.arange(0, n_times + 1, step * sfreq)
+    return positions, [round(float(p) / sfreq, 2) for p in positions]
+
+
+def mean_over_pairs(a, cross = False, diagonal = False):
+    """
+    Mean over the first two axes (sessions x sessions or sessions x folds) of a, read one (T, T) slice at a time,
+    so memory-mapped arrays are never loaded as a whole. Nan entries (padding) are ignored.
+
+    cross: leave out training and testing on the same session
+    diagonal: only read the diagonal of each slice
+    """
+    total, count = 0, 0
+    for i in range(a.shape[0]):
+        for j in range(a.shape[1]):
+            if cross and i == j:
+                continue
+            x = np.array(np.diagonal(a[i, j]) if diagonal else a[i, j], dtype = float)
+            valid = ~np.isnan(x)
+            total = total + np.where(valid, x, 0)
+            count = count + valid
+    return total / count
 
 
 def plot_tgm(X, vmin = 30, vmax = 70, savepath = None, chance_level = None):
-    if not X.shape == (250, 250):
-        raise ValueError('X must be 250, 250')
+    if X.ndim != 2:
+        raise ValueError('X must be a (training time, testing time) matrix')
 
     fig, ax = plt.subplots(1, 1, figsize = (7, 7), dpi = 400)
 
@@ -48,8 +77,8 @@ def plot_tgm(X, vmin = 30, vmax = 70, savepath = None, chance_level = None):
         plt.contour(X*100, levels=[chance_level*100], colors='k', alpha = 0.5, linewidths=1, linestyles='--')
 
 
-    ax.set_yticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
-    ax.set_xticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
+    ax.set_yticks(*time_ticks(X.shape[-1]))
+    ax.set_xticks(*time_ticks(X.shape[-1]))
 
     cb = plt.colorbar(im, ax = ax, location = 'top', shrink = 0.5)
     cb.set_label(label = 'Accuracy (%)')
@@ -78,8 +107,8 @@ def tgm_cross(cross, savepath = None):
     for i in range(cross.shape[0]):
         for j in range(cross.shape[1]):
             axs[i, j].imshow(cross[i, j], vmin = vmin, vmax = vmax, origin = 'lower')
-            axs[i, j].set_xticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
-            axs[i, j].set_yticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
+            axs[i, j].set_xticks(*time_ticks(cross.shape[-1]))
+            axs[i, j].set_yticks(*time_ticks(cross.shape[-1]))
             # rotate x ticks a bit
             for tick in axs[i, j].get_xticklabels():
                 tick.set_rotation(90)
@@ -111,7 +140,7 @@ def diagonal_cross(cross, savepath = None):
                     a.axhline(y = 0.5333333333333333, color = 'k', linewidth = 0.3, linestyle = '--', alpha = 0.4)
                 a.plot(cross[i, j].diagonal(), linewidth = 0.4, alpha = 0.7, label = f'Session {j+1}')
                 a.set_title(f'Training on session {i+1}')
-                a.set_xticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
+                a.set_xticks(*time_ticks(cross.shape[-1]))
                 a.set_ylim(vmin, vmax)
                 # change fontsize of y ticks
                 a.tick_params(axis='y')
@@ -134,18 +163,12 @@ def plot_tgm_difference(a1, a2, savepath = None, cross = False):
     vmin = -0.025*100
     vmax = 0.025*100
 
-    if a1.shape and a2.shape != (7, 7, 250, 250):
-        raise ValueError('Input arrays must be of shape (7, 7, 250, 250)')
-    if not cross:
-        mean_a1 = np.mean(a1, axis = (0, 1))
-        mean_a2 = np.mean(a2, axis = (0, 1))
-    else: 
-        # remove the same session training and testing
-        for i in range(len(a1)):
-            a1[i, i] = np.nan
-            a2[i, i] = np.nan
-        mean_a1 = np.nanmean(a1, axis = (0, 1))
-        mean_a2 = np.nanmean(a2, axis = (0, 1))
+    if a1.shape != a2.shape or a1.ndim != 4:
+        raise ValueError('Input arrays must have the same shape (session, session, time, time)')
+
+    # cross: remove the same session training and testing
+    mean_a1 = mean_over_pairs(a1, cross = cross)
+    mean_a2 = mean_over_pairs(a2, cross = cross)
 
 
     fig, axs = plt.subplots(1, 1, figsize = (7, 7))
@@ -156,8 +179,8 @@ def plot_tgm_difference(a1, a2, savepath = None, cross = False):
     cb.set_label(label = 'Accuracy difference (%)')
 
     # change y and x ticks
-    axs.set_xticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
-    axs.set_yticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
+    axs.set_xticks(*time_ticks(mean_a1.shape[-1]))
+    axs.set_yticks(*time_ticks(mean_a1.shape[-1]))
 
     axs.set_xlabel('Training time (s)')
     axs.set_ylabel('Testing time (s)')
@@ -171,33 +194,24 @@ def plot_tgm_difference(a1, a2, savepath = None, cross = False):
 
 def plot_diagonal_difference(a1, a2, savepath = None, cross = False):
 
-    if a1.shape and a2.shape != (7, 7, 250, 250):
-        raise ValueError('Input arrays must be of shape (7, 7, 250, 250)')
+    if a1.shape != a2.shape or a1.ndim != 4:
+        raise ValueError('Input arrays must have the same shape (session, session, time, time)')
 
-    if not cross:
-        mean_a1 = np.mean(a1, axis = (0, 1))
-        mean_a2 = np.mean(a2, axis = (0, 1))
-    else: 
-        # remove the same session training and testing
-        aa1 = np.copy(a1)
-        aa2 = np.copy(a2)
-        for i in range(len(a1)):
-            aa1[i, i] = np.nan
-            aa2[i, i] = np.nan
-        mean_a1 = np.nanmean(aa1, axis = (0, 1))
-        mean_a2 = np.nanmean(aa2, axis = (0, 1))
+    # only the diagonals are read, cross: remove the same session training and testing
+    mean_a1 = mean_over_pairs(a1, cross = cross, diagonal = True)
+    mean_a2 = mean_over_pairs(a2, cross = cross, diagonal = True)
     
 
     fig, axs = plt.subplots(1, 1, figsize = (7, 4))
 
-    axs.plot(np.arange(0, 250), mean_a1.diagonal()*100 - mean_a2.diagonal()*100, linewidth = 2, alpha = 0.7)
+    axs.plot(np.arange(len(mean_a1)), mean_a1*100 - mean_a2*100, linewidth = 2, alpha = 0.7)
     axs.axhline(y = 0, color = 'k', linewidth = 1, linestyle = '--', alpha = 0.4)
     axs.set_xlabel('Time (s)')
     axs.set_ylabel('Accuracy difference (%)')
 
 
     # change x ticks
-    axs.set_xticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
+    axs.set_xticks(*time_ticks(len(mean_a1)))
     plt.tight_layout()
     if savepath is not None:
         plt.savefig(savepath)
@@ -205,14 +219,8 @@ def plot_diagonal_difference(a1, a2, savepath = None, cross = False):
     plt.close()
 
 def average_tgm(a1, chance, vmin = 35, vmax = 65, savepath = None, cross = False):
-    if not cross:
-        mean_a1 = np.mean(a1, axis = (0, 1))
-    else:
-        a = a1.copy()
-        # remove the same session training and testing
-        for i in range(len(a1)):
-            a[i, i] = np.nan
-        mean_a1 = np.nanmean(a, axis = (0, 1))
+    # cross: remove the same session training and testing
+    mean_a1 = mean_over_pairs(a1, cross = cross)
 
     fig, axs = plt.subplots(1, 1, figsize = (7, 7))
 
@@ -224,8 +232,8 @@ def average_tgm(a1, chance, vmin = 35, vmax = 65, savepath = None, cross = False
     plt.contour(mean_a1*100, levels=[chance*100], colors='k', alpha = 0.5, linewidths=1, linestyles='--')
 
     # change y and x ticks
-    axs.set_xticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
-    axs.set_yticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
+    axs.set_xticks(*time_ticks(mean_a1.shape[-1]))
+    axs.set_yticks(*time_ticks(mean_a1.shape[-1]))
 
     axs.set_xlabel('Training time (s)')
     axs.set_ylabel('Testing time (s)')
@@ -237,26 +245,25 @@ def average_tgm(a1, chance, vmin = 35, vmax = 65, savepath = None, cross = False
     plt.close()
 
 def plot_all_diagonal(a1, savepath = None, ymin = 35, ymax = 65, cross = False):
-    if not cross:
-        mean_a1 = np.mean(a1, axis = 0)
-    else:
+    # only the diagonals are read
+    diags = np.array(np.diagonal(a1, axis1 = 2, axis2 = 3), dtype = float)
+    if cross:
         # remove the same session training and testing
-        a = a1.copy()
-        for i in range(len(a)):
-            a[i, i] = np.nan
-        mean_a1 = np.nanmean(a, axis = 0)
+        for i in range(len(diags)):
+            diags[i, i] = np.nan
+    mean_a1 = np.nanmean(diags, axis = 0)
     
     fig, axs = plt.subplots(1, 1, figsize = (7, 4))
     for i in range(mean_a1.shape[0]):
-        diag = mean_a1[i, :, :].diagonal()*100 # percentage
+        diag = mean_a1[i]*100 # percentage
         if not cross:
-            axs.plot(np.arange(0, 250), diag, linewidth = 1, alpha = 0.7, label = f'{i+1}')
+            axs.plot(np.arange(len(diag)), diag, linewidth = 1, alpha = 0.7, label = f'{i+1}')
         else:
-            axs.plot(np.arange(0, 250), diag, linewidth = 1, alpha = 0.7, label = f'{i+1}')
+            axs.plot(np.arange(len(diag)), diag, linewidth = 1, alpha = 0.7, label = f'{i+1}')
     # plot mean
-    axs.plot(np.arange(0, 250), np.mean(mean_a1, axis = 0).diagonal()*100, linewidth = 1.5, alpha = 1, color = 'k',  label = 'Mean')  
+    axs.plot(np.arange(mean_a1.shape[-1]), np.mean(mean_a1, axis = 0)*100, linewidth = 1.5, alpha = 1, color = 'k',  label = 'Mean')  
 
-    axs.set_xticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
+    axs.set_xticks(*time_ticks(mean_a1.shape[-1]))
     axs.set_ylabel('Accuracy (%)')
     axs.set_xlabel('Time (s)')
     if not cross:
@@ -283,8 +290,8 @@ def within_sesh_cross_tgm(X, chance, savepath = None, vmin = 35, vmax = 65):
     plt.contour(mean_a1*100, levels=[chance*100], colors='k', alpha = 0.5, linewidths=1, linestyles='--')
 
     # change y and x ticks
-    axs.set_xticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
-    axs.set_yticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
+    axs.set_xticks(*time_ticks(mean_a1.shape[-1]))
+    axs.set_yticks(*time_ticks(mean_a1.shape[-1]))
 
     axs.set_xlabel('Training time (s)')
     axs.set_ylabel('Testing time (s)')
@@ -310,8 +317,8 @@ def within_sesh_cross_tgm_diff(X1, X2, savepath = None):
     cb.set_label(label = 'Accuracy difference (%)')
 
     # change y and x ticks
-    axs.set_xticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
-    axs.set_yticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
+    axs.set_xticks(*time_ticks(mean_a1.shape[-1]))
+    axs.set_yticks(*time_ticks(mean_a1.shape[-1]))
 
     axs.set_xlabel('Training time (s)')
     axs.set_ylabel('Testing time (s)')
@@ -330,19 +337,21 @@ def within_sesh_diag_diff(X1, X2, savepath = None):
 
     fig, axs = plt.subplots(1, 1, figsize = (7, 4))
 
-    axs.plot(np.arange(0, 250), mean_a1.diagonal()*100 - mean_a2.diagonal()*100, linewidth = 2, alpha = 0.7)
+    axs.plot(np.arange(mean_a1.shape[-1]), mean_a1.diagonal()*100 - mean_a2.diagonal()*100, linewidth = 2, alpha = 0.7)
     axs.axhline(y = 0, color = 'k', linewidth = 1, linestyle = '--', alpha = 0.4)
     axs.set_xlabel('Time (s)')
     axs.set_ylabel('Accuracy difference (%)')
 
 
     # change x ticks
-    axs.set_xticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
+    axs.set_xticks(*time_ticks(mean_a1.shape[-1]))
 
     plt.tight_layout()
     if savepath is not None:
         plt.savefig(savepath)
 
+    plt.close()
+
 def compare_diagonals(dX, savepath = None):
     """
     dX: Dictionary of accuracies
@@ -352,7 +361,7 @@ def compare_diagonals(dX, savepath = None):
 
     counter = 0
     for key, value in dX.items():
-        ax.plot(np.arange(0, 250), value.diagonal()*100, label = key, linewidth = 1.5, alpha = 0.7, color = colours[counter])
+        ax.plot(np.arange(value.shape[-1]), np.diagonal(value)*100, label = key, linewidth = 1.5, alpha = 0.7, color = colours[counter])
         counter += 1
     
     plt.legend(loc = 'upper right')
@@ -360,7 +369,7 @@ def compare_diagonals(dX, savepath = None):
     plt.ylabel('Accuracy (%)')
 
     # change x ticks
-    ax.set_xticks(np.arange(0, 251, step=50), [0. , 0.2, 0.4, 0.6, 0.8, 1. ])
+    ax.set_xticks(*time_ticks(value.shape[-1]))
 
     plt.tight_layout()
 
@@ -371,58 +380,76 @@ def compare_diagonals(dX, savepath = None):
 
 
 if __name__ in '__main__':
-    lbo = np.load('./accuracies/accuracies_LDA_lbo.npy', allow_pickle=True) # leave batch out
-    propb = np.load('./accuracies/accuracies_LDA_prop.npy', allow_pickle=True) # balanced stratified batch
-    cross = np.load('./accuracies/cross_decoding_ncv_5.npy', allow_pickle=True).squeeze() # cross session
-    cross_sens = np.load('./accuracies/cross_decoding_sens_ncv_5.npy', allow_pickle=True).squeeze() # cross session
+    parser = ap.ArgumentParser()
+    parser.add_argument('--n_jobs', type=int, default=None, help='Number of processes used for rendering')
+    parser.add_argument('--force', action='store_true', help='Render all figures, also the ones that are up to date')
+    parser.add_argument('--profile', default=None, help='JSON lines file the time and memory of rendering each figure are written to (see profiling.py)')
+    args = parser.parse_args()
+    if args.profile:
+        profiling.start(args.profile)
+
+    lbo_path = './accuracies/accuracies_LDA_lbo.npy' # leave batch out
+    propb_path = './accuracies/accuracies_LDA_prop.npy' # balanced stratified batch
+    cross_path = './accuracies/cross_decoding_ncv_5.npy' # cross session
+    cross_sens_path = './accuracies/cross_decoding_sens_ncv_5.npy' # cross session
+
+    # results saved as object arrays are converted once, so they can be memory-mapped
+    for path in [lbo_path, propb_path, cross_path, cross_sens_path]:
+        ensure_numeric(path)
+
+    # the arrays are opened memory-mapped by the rendering processes
+    lbo = ArrayRef(lbo_path)
+    propb = ArrayRef(propb_path)
+    cross = ArrayRef(cross_path, squeeze = True)
+    cross_sens = ArrayRef(cross_sens_path, squeeze = True)
 
     chance_levels = chance_level(alpha = 0.05)
     avg_chance = np.mean(chance_levels)
-
-    # within session decoding cross session
-    within_sesh_cross_tgm(cross, avg_chance, savepath = f'./plots/cross_within_tgm_source.png', vmin = 35, vmax = 65)
-    within_sesh_cross_tgm(cross_sens, avg_chance, savepath = f'./plots/cross_within_tgm_sens.png', vmin = 35, vmax = 65)
-    within_sesh_cross_tgm_diff(cross_sens, cross, savepath = f'./plots/cross_within_tgm_diff.png')
-    within_sesh_diag_diff(cross_sens, cross, savepath = f'./plots/cross_within_diag_diff.png')
-
-    # plot session 5 (session with highest variance in sensor space)
-    chance_levels = chance_level()
-    plot_tgm(cross_sens[4, 4, :, :], savepath = f'./plots/cross_sesh5_sens.png', vmin = 35, vmax = 65, chance_level = chance_levels[4])
-    plot_tgm(cross[4, 4, :, :], savepath = f'./plots/cross_sesh5_source.png', vmin = 35, vmax = 65, chance_level = chance_levels[4])
-    compare_diagonals({'Source space': cross[4, 4, :, :], 'Sensor space': cross_sens[4, 4, :, :]}, savepath = f'./plots/cross_sesh5_diagonals.png')
-    
-    # plot session 6 (session with lowest variance in sensor space)
-    plot_tgm(cross_sens[5, 5, :, :], savepath = f'./plots/cross_sesh6_sens.png', vmin = 35, vmax = 65, chance_level = chance_levels[5])
-    plot_tgm(cross[5, 5, :, :], savepath = f'./plots/cross_sesh6_source.png', vmin = 35, vmax = 65, chance_level = chance_levels[5])
-    compare_diagonals({'Source space': cross[5, 5, :, :], 'Sensor space': cross_sens[5, 5, :, :]}, savepath = f'./plots/cross_sesh6_diagonals.png')
-
-
-    tgm_cross(cross, savepath = f'./plots/cross_session_tgm.png')
-    tgm_cross(cross_sens, savepath = f'./plots/cross_session_tgm_sens.png')
-    
-    diagonal_cross(cross, savepath = f'./plots/cross_session_diagonal.png')
-    diagonal_cross(cross_sens, savepath = f'./plots/cross_session_diagonal_sens.png')
-
-
-    # accuracy difference plots
-    plot_tgm_difference(lbo, propb, savepath = f'./plots/within_tgm_difference.png')
-    plot_diagonal_difference(lbo, propb, savepath = f'./plots/within_diagonal_difference.png')
-
-    plot_tgm_difference(cross_sens, cross, savepath = f'./plots/cross_tgm_difference.png', cross = True)
-    plot_diagonal_difference(cross_sens, cross, savepath = f'./plots/cross_diagonal_difference.png', cross = True)
-
-    # all tgms averaged
-    average_tgm(lbo, avg_chance, savepath = f'./plots/average_tgm_lbo.png', vmin = 35, vmax = 65)
-    average_tgm(propb, avg_chance, savepath = f'./plots/average_tgm_prop.png',  vmin = 35, vmax = 65)
-
-    average_tgm(cross, avg_chance, savepath = f'./plots/average_tgm_cross.png', vmin = 40, vmax = 60, cross=True)
-    average_tgm(cross_sens, avg_chance, savepath = f'./plots/average_tgm_cross_sens.png', vmin = 40, vmax = 60, cross=True)
-
-    # all diagonals
-    plot_all_diagonal(lbo, savepath = f'./plots/diagonal_lbo.png', ymin = 35, ymax = 65)
-    plot_all_diagonal(propb, savepath = f'./plots/diagonal_prop.png', ymin = 35, ymax = 65)
-
-    plot_all_diagonal(cross, savepath = f'./plots/diagonal_cross.png', ymin = 40, ymax = 60, cross=True)
-    plot_all_diagonal(cross_sens, savepath = f'./plots/diagonal_cross_sens.png', ymin = 40, ymax = 60, cross=True)
-
-
+    chance_levels_001 = chance_level()
+    manifest_input = (manifest.manifest_path, )
+
+    jobs = [
+        # within session decoding cross session
+        FigureJob(within_sesh_cross_tgm, './plots/cross_within_tgm_source.png', (cross, avg_chance), dict(vmin = 35, vmax = 65), inputs = manifest_input),
+        FigureJob(within_sesh_cross_tgm, './plots/cross_within_tgm_sens.png', (cross_sens, avg_chance), dict(vmin = 35, vmax = 65), inputs = manifest_input),
+        FigureJob(within_sesh_cross_tgm_diff, './plots/cross_within_tgm_diff.png', (cross_sens, cross)),
+        FigureJob(within_sesh_diag_diff, './plots/cross_within_diag_diff.png', (cross_sens, cross)),
+
+        # plot session 5 (session with highest variance in sensor space)
+        FigureJob(plot_tgm, './plots/cross_sesh5_sens.png', (ArrayRef(cross_sens_path, (4, 4)), ), dict(vmin = 35, vmax = 65, chance_level = chance_levels_001[4]), inputs = manifest_input),
+        FigureJob(plot_tgm, './plots/cross_sesh5_source.png', (ArrayRef(cross_path, (4, 4)), ), dict(vmin = 35, vmax = 65, chance_level = chance_levels_001[4]), inputs = manifest_input),
+        FigureJob(compare_diagonals, './plots/cross_sesh5_diagonals.png', ({'Source space': ArrayRef(cross_path, (4, 4)), 'Sensor space': ArrayRef(cross_sens_path, (4, 4))}, )),
+
+        # plot session 6 (session with lowest variance in sensor space)
+        FigureJob(plot_tgm, './plots/cross_sesh6_sens.png', (ArrayRef(cross_sens_path, (5, 5)), ), dict(vmin = 35, vmax = 65, chance_level = chance_levels_001[5]), inputs = manifest_input),
+        FigureJob(plot_tgm, './plots/cross_sesh6_source.png', (ArrayRef(cross_path, (5, 5)), ), dict(vmin = 35, vmax = 65, chance_level = chance_levels_001[5]), inputs = manifest_input),
+        FigureJob(compare_diagonals, './plots/cross_sesh6_diagonals.png', ({'Source space': ArrayRef(cross_path, (5, 5)), 'Sensor space': ArrayRef(cross_sens_path, (5, 5))}, )),
+
+        FigureJob(tgm_cross, './plots/cross_session_tgm.png', (cross, )),
+        FigureJob(tgm_cross, './plots/cross_session_tgm_sens.png', (cross_sens, )),
+        FigureJob(diagonal_cross, './plots/cross_session_diagonal.png', (cross, )),
+        FigureJob(diagonal_cross, './plots/cross_session_diagonal_sens.png', (cross_sens, )),
+
+        # accuracy difference plots
+        FigureJob(plot_tgm_difference, './plots/within_tgm_difference.png', (lbo, propb)),
+        FigureJob(plot_diagonal_difference, './plots/within_diagonal_difference.png', (lbo, propb)),
+        FigureJob(plot_tgm_difference, './plots/cross_tgm_difference.png', (cross_sens, cross), dict(cross = True)),
+        FigureJob(plot_diagonal_difference, './plots/cross_diagonal_difference.png', (cross_sens, cross), dict(cross = True)),
+
+        # all tgms averaged
+        FigureJob(average_tgm, './plots/average_tgm_lbo.png', (lbo, avg_chance), dict(vmin = 35, vmax = 65), inputs = manifest_input),
+        FigureJob(average_tgm, './plots/average_tgm_prop.png', (propb, avg_chance), dict(vmin = 35, vmax = 65), inputs = manifest_input),
+        FigureJob(average_tgm, './plots/average_tgm_cross.png', (cross, avg_chance), dict(vmin = 40, vmax = 60, cross = True), inputs = manifest_input),
+        FigureJob(average_tgm, './plots/average_tgm_cross_sens.png', (cross_sens, avg_chance), dict(vmin = 40, vmax = 60, cross = True), inputs = manifest_input),
+
+        # all diagonals
+        FigureJob(plot_all_diagonal, './plots/diagonal_lbo.png', (lbo, ), dict(ymin = 35, ymax = 65)),
+        FigureJob(plot_all_diagonal, './plots/diagonal_prop.png', (propb, ), dict(ymin = 35, ymax = 65)),
+        FigureJob(plot_all_diagonal, './plots/diagonal_cross.png', (cross, ), dict(ymin = 40, ymax = 60, cross = True)),
+        FigureJob(plot_all_diagonal, './plots/diagonal_cross_sens.png', (cross_sens, ), dict(ymin = 40, ymax = 60, cross = True)),
+    ]
+
+    render_jobs(jobs, n_jobs = args.n_jobs, force = args.force)
+
+    if profiling.enabled():
+        profiling.report(profiling.trace_path())
@@ -0,0 +1,215 @@
+"""
+Per stage timing and memory of the pipeline, written as JSON lines.
+
+A stage is timed with the stage context manager or the traced decorator:
+
+    with profiling.stage('fit', cv_fold = 3):
+        ...
+
+    @profiling.traced('save')
+    def save_accuracies(...):
+
+Every stage writes one record with its wall time, CPU time and the peak resident set size while it ran,
+together with the fields given to it and to the stages it is nested in, so the fit of a fold carries the
+session or pair of sessions it belongs to. Nothing is recorded until profiling is switched on with start(path),
+or by setting the PROFILE_PATH environment variable, which is also how worker processes started afterwards
+know where to write; until then a stage costs a function call. The records of all processes are appended to
+the same file and report(path) summarises them.
+
+The CPU time and the peak RSS are those of the whole process, so with the thread backend they include the
+other threads. The peak RSS is read from VmHWM in /proc/self/status, which is reset at the start of each stage
+on Linux; elsewhere it falls back to the peak of the process so far (ru_maxrss). The reset applies to the whole
+process, so it is skipped while another thread has a stage open: the records of such stages are marked
+concurrent and their peak can date from before the stage started.
+
+Usage: python profiling.py PATH [--by stage session ...]
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import itertools
+import threading
+import argparse as ap
+from functools import wraps
+from contextlib import contextmanager
+
+env_var = 'PROFILE_PATH'
+
+# open stages of each thread, innermost last
+_local = threading.local()
+_ids = itertools.count()
+# number of threads with an open stage, the peak RSS is only reset when no other thread has one
+_lock = threading.Lock()
+_open_threads = 0
+
+
+def start(path):
+    """Appends the records of this process and of the worker processes started afterwards to path."""
+    path = os.path.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    os.environ[env_var] = path
+
+
+def stop():
+    os.environ.pop(env_var, None)
+
+
+def trace_path():
+    """Path the records are written to, None if profiling is off."""
+    return os.environ.get(env_var) or None
+
+
+def enabled():
+    return trace_path() is not None
+
+
+def _peak_rss():
+    """Peak resident set size (MB) since the last reset."""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    # kB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024**2 if sys.platform == 'darwin' else rss / 1024
+
+
+def _reset_peak():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _json_default(value):
+    # numpy scalars (e.g. session indices) and anything else
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+def _write(path, record):
+    # one write per record, so the lines of concurrent processes do not interleave
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, default = _json_default) + '\n')
+
+
+@contextmanager
+def stage(name, **fields):
+    """Records the wall time, CPU time and peak RSS of the block as stage name with the given fields
+    (e.g. session = 2) and the fields of the enclosing stages."""
+    path = trace_path()
+    if path is None:
+        yield
+        return
+
+    global _open_threads
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+
+    with _lock:
+        if parent is None:
+            _open_threads += 1
+        concurrent = _open_threads > 1
+        # the peak of the enclosing stage so far is kept before the counter is reset for this one
+        if parent is not None:
+            parent['peak'] = max(parent['peak'], _peak_rss())
+        if not concurrent:
+            _reset_peak()
+
+    frame = {'id': f'{os.getpid()}-{next(_ids)}', 'name': name, 'fields': dict(parent['fields'] if parent else {}, **fields), 'peak': 0.}
+    stack.append(frame)
+    error = None
+    st_time, st_wall, st_cpu = time.time(), time.perf_counter(), time.process_time()
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        wall, cpu = time.perf_counter() - st_wall, time.process_time() - st_cpu
+        peak = max(frame['peak'], _peak_rss())
+        stack.pop()
+        if parent is not None:
+            parent['peak'] = max(parent['peak'], peak)
+        else:
+            with _lock:
+                _open_threads -= 1
+
+        record = dict(frame['fields'], stage = name, path = '/'.join([f['name'] for f in stack] + [name]), wall = wall, cpu = cpu,
+                      peak_rss_mb = peak, start = st_time, pid = os.getpid(), id = frame['id'], parent = parent['id'] if parent else None)
+        if concurrent:
+            record['concurrent'] = True
+        if error is not None:
+            record['error'] = error
+        _write(path, record)
+
+
+def traced(name = None, **fields):
+    """Decorator recording every call of the function as a stage (by default named after the function)."""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name or func.__name__, **fields):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def load_trace(path):
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summary(records, by = ('stage', )):
+    """Totals of the records grouped by the fields in by.
+
+    Returns
+    -------
+    dict mapping a tuple of the values of by to the number of records, the summed wall and CPU time, the self
+        time (wall time minus that of the nested stages) and the maximum peak RSS
+    """
+    nested = {}
+    for r in records:
+        if r.get('parent') is not None:
+            nested[r['parent']] = nested.get(r['parent'], 0.) + r['wall']
+
+    groups = {}
+    for r in records:
+        g = groups.setdefault(tuple(r.get(field) for field in by), {'count': 0, 'wall': 0., 'cpu': 0., 'self': 0., 'peak_rss_mb': 0.})
+        g['count'] += 1
+        g['wall'] += r['wall']
+        g['cpu'] += r['cpu']
+        g['self'] += r['wall'] - nested.get(r.get('id'), 0.)
+        g['peak_rss_mb'] = max(g['peak_rss_mb'], r['peak_rss_mb'])
+
+    return groups
+
+
+def report(path, by = ('stage', )):
+    """Prints the summary of the records in path, the groups with the largest total wall time first."""
+    records = load_trace(path)
+    groups = summary(records, by)
+    print(f'{len(records)} records from {len({r["pid"] for r in records})} processes in {path}')
+
+    key_width = max([len(' '.join(by))] + [len(' '.join(str(k) for k in key)) for key in groups])
+    print(f'{" ".join(by):{key_width}s} {"count":>7s} {"wall (s)":>10s} {"self (s)":>10s} {"mean (s)":>10s} {"cpu (s)":>10s} {"peak RSS (MB)":>14s}')
+    for key, g in sorted(groups.items(), key = lambda item: -item[1]['wall']):
+        print(f'{" ".join(str(k) for k in key):{key_width}s} {g["count"]:7d} {g["wall"]:10.2f} {g["self"]:10.2f} {g["wall"] / g["count"]:10.4f} {g["cpu"]:10.2f} {g["peak_rss_mb"]:14.0f}')
+
+
+if __name__ == '__main__':
+    parser = ap.ArgumentParser()
+    parser.add_argument('path', help = 'JSON lines file written by the profiled run')
+    parser.add_argument('--by', nargs = '+', default = ['stage'], help = 'Fields the records are grouped by, e.g. stage session')
+    args = parser.parse_args()
+
+    report(args.path, args.by)
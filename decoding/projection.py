@@ -0,0 +1,63 @@
+"""
+PCA / whitening stage fitted on the training data of a fold, with an on-disk cache of the projections.
+
+One projection is fitted per fold on the training trials pooled over time points with randomized SVD,
+and applied to the training and testing data of the fold. Sensor space data (306 channels) can then be
+decoded from far fewer components. The projections are saved per (session, fold) so the train/test
+pairs in cross_decoding.py that share a training fold reuse them.
+"""
+
+import os
+import hashlib
+import numpy as np
+from sklearn.utils.extmath import randomized_svd
+
+
+def fit_pca(X, n_components, whiten = False, random_state = 0):
+    """PCA of the trials of X (T, N, C) pooled over time points.
+
+    Returns
+    -------
+    projection : dict with the mean (C, ), the components (C, n_components) and the scale (n_components, ),
+        which is the standard deviation of each component if whiten is True and 1 otherwise
+    """
+    T, N, C = X.shape
+    X = X.reshape(T * N, C)
+    mean = np.mean(X, axis = 0, dtype = np.float64)
+    _, S, Vt = randomized_svd(X - mean.astype(X.dtype), n_components, random_state = random_state)
+
+    scale = S / np.sqrt(T * N) if whiten else np.ones(len(S))
+    scale[scale == 0] = 1
+
+    return {'mean': mean, 'components': Vt.T, 'scale': scale}
+
+
+def apply_projection(X, projection):
+    """Projects X (T, N, C) on the components, (T, N, n_components) in the dtype of X."""
+    mean = projection['mean'].astype(X.dtype)
+    components = (projection['components'] / projection['scale'][None, :]).astype(X.dtype)
+    return np.matmul(X - mean, components)
+
+
+def index_digest(inds):
+    """Short hash of the trial indices of a fold, part of the cache key."""
+    return hashlib.sha1(np.ascontiguousarray(inds, dtype = np.int64).tobytes()).hexdigest()[:12]
+
+
+def cached_projection(cache_dir, key, fit):
+    """Loads the projection saved under key in cache_dir, or fits it with fit() and saves it."""
+    path = os.path.join(cache_dir, f'{key}.npz')
+    try:
+        with np.load(path) as f:
+            return {name: f[name] for name in f.files}
+    except FileNotFoundError:
+        pass
+
+    projection = fit()
+    os.makedirs(cache_dir, exist_ok = True)
+    # several processes may fit the same fold, the file is replaced atomically
+    tmp_path = f'{path[:-4]}_{os.getpid()}.tmp.npz'
+    np.savez(tmp_path, **projection)
+    os.replace(tmp_path, path)
+
+    return projection
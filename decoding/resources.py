@@ -0,0 +1,86 @@
+"""
+Number of processes and BLAS threads used by the parallel scripts.
+
+Every worker process of a pool gets its own BLAS thread pool, by default with one thread per core, so
+n processes on n cores run n^2 threads that compete for the same cores. plan splits the cores into
+processes x threads per process, init_worker applies the thread limit inside each worker and autotune
+times a few splits on a task of the actual data.
+
+Scripts outside decoding/ import it with sys.path.append('../decoding').
+"""
+
+import os
+import time
+import multiprocessing as mp
+from collections import namedtuple
+from threadpoolctl import threadpool_limits
+
+# read by OpenMP and the BLAS libraries of processes started after they are set
+thread_variables = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'BLIS_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+Split = namedtuple('Split', ['n_processes', 'threads'])
+
+
+def available_cores():
+    """Number of cores this process may run on (respects taskset and batch system limits)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return mp.cpu_count()
+
+
+def plan(n_tasks, threads = None, n_cores = None):
+    """Splits the cores into processes x BLAS threads per process for n_tasks independent tasks.
+
+    With threads = None every process gets one thread, unless there are fewer tasks than cores, in
+    which case the spare cores go to the BLAS threads of the processes.
+    """
+    n_cores = n_cores or available_cores()
+    if threads is None:
+        threads = max(1, n_cores // max(1, n_tasks))
+    n_processes = max(1, min(n_tasks, n_cores // threads))
+
+    return Split(n_processes, threads)
+
+
+def limit_threads(threads):
+    """Limits the BLAS and OpenMP threads of this process and of the processes it starts."""
+    for variable in thread_variables:
+        os.environ[variable] = str(threads)
+    threadpool_limits(threads)
+
+
+def init_worker(threads):
+    """Pool initializer applying the thread limit inside each worker, run by every backend of executors.Executor."""
+    limit_threads(threads)
+
+
+def autotune(task, n_tasks, candidates = None, n_cores = None):
+    """Picks the split with the shortest estimated run time for n_tasks tasks like task().
+
+    task() is timed in this process with each candidate number of threads per process (1, 2, 4, ... up to the
+    number of cores by default). The run time of a split is estimated as ceil(n_tasks / n_processes) times the
+    time of one task. Tasks running side by side also share the memory bandwidth, which the estimate ignores,
+    so it is meant to rule out bad splits rather than to predict the run time.
+
+    Returns
+    -------
+    split : the Split with the shortest estimated run time
+    timings : dict with the time of one task (s) for each number of threads
+    """
+    n_cores = n_cores or available_cores()
+    if candidates is None:
+        candidates = [2**i for i in range(n_cores.bit_length()) if 2**i <= n_cores]
+
+    timings, estimates = {}, {}
+    for threads in candidates:
+        with threadpool_limits(threads):
+            st = time.perf_counter()
+            task()
+            timings[threads] = time.perf_counter() - st
+
+        split = plan(n_tasks, threads, n_cores)
+        estimates[split] = -(-n_tasks // split.n_processes) * timings[threads]
+        print(f'{split.n_processes} processes x {threads} threads: {timings[threads]:.2f} s per task, {estimates[split]:.1f} s estimated')
+
+    return min(estimates, key = estimates.get), timings
@@ -0,0 +1,114 @@
+"""
+Parcel-wise searchlight decoding: at every time point an LDA is trained on each aparc.a2009s label
+alone, or on the label and its nearest neighbouring labels.
+
+Instead of one scikit-learn fit per (label, time point), the datasets of a chunk of labels are
+stacked along the first axis and lda_fit solves all their small (m, m) problems at once. The
+(session, label chunk) jobs are distributed over an executor (see executors.py). The result is a (session, label, time)
+accuracy map saved with accuracy_store.
+
+Usage: python searchlight.py [--n_neighbours N_NEIGHBOURS]
+"""
+
+import argparse as ap
+import time
+import numpy as np
+from decoding import prep_data
+from accuracy_store import save_accuracies
+from linear_models import lda_fit, predict
+import resources
+import executors
+
+ncv = 7
+alpha = 'auto' # shrinkage of the LDA, 'auto', None or a float
+chunk_size = 16 # labels per job
+threads_per_process = None # BLAS threads per worker, None lets resources.plan split the cores
+backend = 'process' # executor running the jobs: 'serial', 'thread', 'process' or 'dask'
+# written by source_reconstruction/epochs_2_source_space.py, in the order of the label time courses
+centroid_path = '/media/8.1/final_data/laurap/source_space/parcelled/label_centroids.npy'
+
+
+def neighbourhoods(n_labels, n_neighbours = 0, centroids = None):
+    """Indices (n_labels, 1 + n_neighbours) of every label followed by its nearest labels.
+
+    centroids : (n_labels, 3) label positions, only needed if n_neighbours > 0
+    """
+    if n_neighbours == 0:
+        return np.arange(n_labels)[:, None]
+
+    dist = np.linalg.norm(centroids[:, None, :] - centroids[None, :, :], axis = -1)
+    dist[np.arange(n_labels), np.arange(n_labels)] = -1 # the label itself comes first
+
+    return np.argsort(dist, axis = 1, kind = 'stable')[:, :n_neighbours + 1]
+
+
+def searchlight_fold(X_train, y_train, X_test, y_test, nbhd, shrinkage = alpha):
+    """Accuracy (L, T) of an LDA on each neighbourhood and time point, fitted on X_train (T, N, C).
+
+    nbhd : (L, m) label indices of each neighbourhood
+    """
+    T = X_train.shape[0]
+    L, m = nbhd.shape
+
+    # (T, N, L, m) -> (L * T, N, m): one small dataset per neighbourhood and time point
+    stack = lambda X: X[:, :, nbhd].transpose(2, 0, 1, 3).reshape(L * T, X.shape[1], m)
+
+    coef, intercept, classes = lda_fit(stack(X_train), y_train, shrinkage, chunk_size = L * T)
+    decision = np.matmul(stack(X_test), coef) + intercept[:, None, :]
+    acc = np.mean(predict(decision, classes) == y_test[None, :], axis = 1)
+
+    return acc.reshape(L, T)
+
+
+def searchlight(X, y, nbhd, ncv = ncv, shrinkage = alpha, seed = 0):
+    """Cross-validated searchlight accuracy (L, T) of one session, X is (T, N, C).
+
+    The folds only depend on seed, so chunks of labels run separately share them.
+    """
+    N = X.shape[1]
+    inds = np.arange(N)
+    np.random.RandomState(seed).shuffle(inds)
+
+    acc = 0
+    for c in range(ncv):
+        inds_test = inds[int(N/ncv) * c : int(N/ncv) * (c+1)]
+        inds_train = np.setdiff1d(inds, inds_test)
+        acc = acc + searchlight_fold(X[:, inds_train], y[inds_train], X[:, inds_test], y[inds_test], nbhd, shrinkage)
+
+    return acc / ncv
+
+
+def run_job(job):
+    session, labels = job
+    Xsesh, ysesh, nbhd = executors.shared['Xsesh'], executors.shared['ysesh'], executors.shared['nbhd']
+    return session, labels, searchlight(Xsesh[session], ysesh[session], nbhd[labels], seed = session)
+
+
+if __name__ == '__main__':
+    parser = ap.ArgumentParser()
+    parser.add_argument('--n_neighbours', type = int, default = 0, help = 'Number of nearest labels added to each label')
+    args = parser.parse_args()
+
+    st = time.time()
+    Xbin, ybin, Xsesh, ysesh = prep_data()
+    del Xbin, ybin
+
+    Xsesh = [np.concatenate(i, axis = 2).squeeze() for i in Xsesh]
+    ysesh = [np.concatenate(i, axis = 0) for i in ysesh]
+    T, _, n_labels = Xsesh[0].shape
+
+    centroids = np.load(centroid_path) if args.n_neighbours > 0 else None
+    nbhd = neighbourhoods(n_labels, args.n_neighbours, centroids)
+
+    jobs = [(session, slice(start, start + chunk_size)) for session in range(len(Xsesh)) for start in range(0, n_labels, chunk_size)]
+
+    accuracies = np.zeros((len(Xsesh), n_labels, T))
+    split = resources.plan(len(jobs), threads_per_process)
+    data = {'Xsesh': Xsesh, 'ysesh': ysesh, 'nbhd': nbhd}
+    with executors.Executor(backend, split, initializer = executors.share, initargs = (data, )) as executor:
+        for session, labels, acc in executor.map(run_job, jobs):
+            accuracies[session, labels] = acc
+
+    print(f'Time taken: {time.time() - st:.1f} s')
+
+    save_accuracies(f'./accuracies/searchlight_n{args.n_neighbours}.npy', accuracies, ['session', 'label', 'time'], alpha = alpha, ncv = ncv, n_neighbours = args.n_neighbours)
@@ -0,0 +1,187 @@
+"""
+Low-latency application of trained diagonal decoders to epochs as they arrive.
+
+The decoders are loaded from a model bundle (see model_bundle.py), written by export_weights or by the
+decoders with keep_models. StreamingDecoder folds the scaler and the unit scaling of the training data into
+the weights when loading, so it takes epochs in the recorded units (T), and scores a single epoch or a
+micro-batch with one batched matmul into preallocated buffers, so no memory is allocated per call.
+
+Recorded -epo.fif files can be fed as a stream with replay_file, or over a local socket with
+serve_epochs / receive_epochs as a stand-in for the acquisition system.
+
+Usage: python streaming.py --weights WEIGHTS --epochs EPOCHS [--batch BATCH] [--port PORT]
+"""
+
+import argparse as ap
+import socket
+import struct
+import threading
+import time
+import numpy as np
+from linear_models import lda_fit, scaler_params
+from model_bundle import write_bundle, load_bundle, bundle_weights
+
+header = struct.Struct('<3i') # number of epochs, channels and time points of a message
+
+
+def export_weights(path, X, y, shrinkage = 'auto', classes = None, unit_scale = 1.):
+    """Fits the diagonal LDA decoders on X (T, N, C) and saves them to path (.npy) as a model bundle with one fold.
+
+    unit_scale is the factor X was multiplied by when it was loaded (e.g. decoding.sens_unit for sensor data
+    loaded with a dtype), it is undone when the bundle is applied to the streamed epochs.
+    """
+    coef, intercept, fitted_classes, recorded = lda_fit(X, y, shrinkage, return_shrinkage = True)
+    mean, scale = scaler_params(X)
+
+    # weights on standardised data, the inverse of linear_models.unscale
+    coef_std = coef * scale[..., None]
+    intercept_std = intercept + np.sum(mean[..., None] * coef, axis = -2)
+
+    arrays = {'coef': coef_std[None], 'intercept': intercept_std[None], 'mean': mean[None], 'scale': scale[None], 'shrinkage': recorded[None]}
+    write_bundle(path, arrays, fitted_classes if classes is None else classes, dtype = X.dtype, unit_scale = unit_scale, model_type = 'LDA', alpha = shrinkage, window = 1)
+
+
+class StreamingDecoder():
+    def __init__(self, path, fold = 0, max_batch = 32, dtype = None):
+        """
+        Loads the models of one fold of a model bundle and preallocates the buffers for micro-batches of up
+        to max_batch epochs. Epochs are (C, T) arrays in the recorded units, as returned by mne.Epochs.get_data().
+        The epochs are scored in dtype, by default the dtype of the training data, and the predictions are
+        the labels of the bundle.
+        """
+        bundle = load_bundle(path)
+        if bundle['info'].get('window', 1) != 1:
+            raise ValueError('Streaming needs the models of single time points, the bundle was fitted with window > 1')
+        coef, intercept = bundle_weights(bundle, fold)
+        dtype = bundle['dtype'] if dtype is None else dtype
+        self.coef = coef.astype(dtype) # (T, C, K)
+        self.intercept = intercept.astype(dtype) # (T, K)
+        self.classes = bundle['classes']
+        self.labels = bundle['labels']
+
+        T, C, K = self.coef.shape
+        self.max_batch = max_batch
+        self._input = np.empty((max_batch, C, T), dtype = dtype)
+        self._decision = np.empty((T, max_batch, K), dtype = dtype)
+        self._index = np.empty((T, max_batch), dtype = np.intp)
+        self._pred = np.empty((T, max_batch), dtype = self.labels.dtype)
+
+
+    def decision_function(self, epochs):
+        """Decision values (T, B, K) of the decoder of every time point for an epoch (C, T) or micro-batch (B, C, T).
+
+        The returned array is a view of an internal buffer that is overwritten by the next call.
+        """
+        if epochs.ndim == 2:
+            epochs = epochs[None]
+        B = epochs.shape[0]
+        if B > self.max_batch:
+            raise ValueError(f'Micro-batch of {B} epochs is larger than max_batch = {self.max_batch}')
+
+        X = self._input[:B]
+        np.copyto(X, epochs, casting = 'same_kind')
+        decision = self._decision[:, :B]
+        # (T, B, C) @ (T, C, K): one batched matmul for all time points
+        np.matmul(X.transpose(2, 0, 1), self.coef, out = decision)
+        np.add(decision, self.intercept[:, None, :], out = decision)
+
+        return decision
+
+
+    def predict(self, epochs):
+        """Predicted labels (T, B) for an epoch or micro-batch, a view of an internal buffer."""
+        decision = self.decision_function(epochs)
+        index = self._index[:, :decision.shape[1]]
+        if decision.shape[-1] == 1:
+            np.greater(decision[..., 0], 0, out = index, casting = 'unsafe')
+        else:
+            np.argmax(decision, axis = -1, out = index)
+
+        return np.take(self.labels, index, out = self._pred[:, :decision.shape[1]])
+
+
+def replay_file(path, batch_size = 1, realtime = False, picks = 'meg'):
+    """Yields the epochs of a -epo.fif file in micro-batches (B, C, T).
+
+    With realtime the batches are paced at the epoch duration, as they would arrive during recording.
+    """
+    import mne
+    epochs = mne.read_epochs(path, verbose = False)
+    data = epochs.get_data(picks = picks)
+    duration = epochs.times[-1] - epochs.times[0]
+
+    for start in range(0, len(data), batch_size):
+        if realtime:
+            time.sleep(duration * min(batch_size, len(data) - start))
+        yield data[start:start + batch_size]
+
+
+def serve_epochs(path, port = 5000, host = 'localhost', batch_size = 1, realtime = False):
+    """Sends the epochs of a -epo.fif file to the first client connecting to (host, port), as float32 messages."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, port))
+        server.listen(1)
+        conn, _ = server.accept()
+        with conn:
+            for batch in replay_file(path, batch_size, realtime):
+                conn.sendall(header.pack(*batch.shape) + batch.astype(np.float32).tobytes())
+
+
+def receive_epochs(port = 5000, host = 'localhost', max_batch = 32, n_channels = 306, n_times = 250):
+    """Yields the micro-batches (B, C, T) sent by serve_epochs, received into one preallocated buffer.
+
+    The yielded arrays are views of that buffer, valid until the next batch is received.
+    """
+    buffer = np.empty(max_batch * n_channels * n_times, dtype = np.float32)
+    head = bytearray(header.size)
+
+    with socket.create_connection((host, port)) as conn:
+        while True:
+            if not _recv_into(conn, memoryview(head)):
+                return
+            B, C, T = header.unpack(head)
+            if B * C * T > buffer.size:
+                raise ValueError(f'Message of shape {(B, C, T)} does not fit the buffer, increase max_batch, n_channels or n_times')
+            data = buffer[:B * C * T]
+            if not _recv_into(conn, memoryview(data).cast('B')):
+                return
+            yield data.reshape(B, C, T)
+
+
+def _recv_into(conn, view):
+    """Fills view from the socket, returns False if the connection was closed."""
+    while len(view):
+        n = conn.recv_into(view)
+        if n == 0:
+            return False
+        view = view[n:]
+    return True
+
+
+if __name__ == '__main__':
+    parser = ap.ArgumentParser()
+    parser.add_argument('--weights', required = True, help = 'Model bundle saved by export_weights or with keep_models')
+    parser.add_argument('--epochs', required = True, help = 'Recorded -epo.fif file to replay')
+    parser.add_argument('--batch', type = int, default = 1, help = 'Number of epochs per micro-batch')
+    parser.add_argument('--port', type = int, default = None, help = 'Replay over a local socket instead of reading the file directly')
+    args = parser.parse_args()
+
+    decoder = StreamingDecoder(args.weights, max_batch = args.batch)
+    T, C, _ = decoder.coef.shape
+
+    if args.port is None:
+        stream = replay_file(args.epochs, args.batch)
+    else:
+        threading.Thread(target = serve_epochs, args = (args.epochs, args.port), kwargs = {'batch_size': args.batch}, daemon = True).start()
+        time.sleep(0.5)
+        stream = receive_epochs(args.port, max_batch = args.batch, n_channels = C, n_times = T)
+
+    latencies = []
+    for batch in stream:
+        st = time.perf_counter()
+        decoder.predict(batch)
+        latencies.append((time.perf_counter() - st) / len(batch))
+
+    latencies = np.array(latencies) * 1000
+    print(f'{len(latencies)} batches, latency per epoch: median {np.median(latencies):.3f} ms, 99th percentile {np.percentile(latencies, 99):.3f} ms')
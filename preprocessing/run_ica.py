@@ -1,5 +1,6 @@
 '''
 Usage, e.g., python run_ica.py -i '/media/8.1/raw_data/franscescas_data/raw_data/memory_01.fif'
+Several files are processed in parallel, e.g., python run_ica.py -i memory_01.fif memory_02.fif -n 2
 
 This script is used for initial preprocessing. The following steps are included:
     1) Excludes bad-channels based on file 'session_info.txt'. These channels were marked as bad based on visual expection of raw MEG data.
@@ -10,9 +11,13 @@ This script is used for initial preprocessing. The following steps are included:
 The script saves the ICA to a file. Unwanted components are manually detected and removed the file 'check_ica.ipynb'.
 '''
 
+import sys
+sys.path.append('../decoding')
 import argparse
 import mne
 import json
+import resources
+import executors
 
 def main(filepath):
     filename = filepath.split('/')[-1]
@@ -62,6 +67,11 @@ def main(filepath):
 
 if __name__ == '__main__':
     ap = argparse.ArgumentParser()
-    ap.add_argument('-in', '--infile', required=True, help='path to fif file')
+    ap.add_argument('-in', '--infile', required=True, nargs='+', help='path to fif file, or several')
+    ap.add_argument('-n', '--n_parallel', type=int, default=None, help='maximum number of files processed at the same time (by default all), the cores are split between them')
     args = vars(ap.parse_args())
-    main(args['infile'])
\ No newline at end of file
+
+    files = args['infile']
+    split = resources.plan(min(len(files), args['n_parallel'] or len(files)))
+    with executors.Executor('serial' if split.n_processes == 1 else 'process', split) as executor:
+        list(executor.map(main, files))
\ No newline at end of file
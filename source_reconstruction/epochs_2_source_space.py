@@ -3,13 +3,18 @@ To set up source space FreeSurfer was initially used for MRI reconstruction. See
 MNE code used for setting up source space and creating BEM surfaces can be found in `source_space.py`. 
 
 Usage, e.g., python epochs_2_source_space.py -s 'memory_01'
+Several sessions are processed in parallel, e.g., python epochs_2_source_space.py -s memory_01 memory_02 -n 2
 '''
 
+import sys
+sys.path.append('../decoding')
 import mne
 import argparse
 import scipy.io as sio
 import numpy as np
 import nibabel as nib
+import resources
+import executors
 
 def get_hpi_meg(epochs):
     hpi_coil_pos = np.array([dig['r'] for dig in epochs.info['hpi_results'][0]['dig_points']]) # not 100 percent sure these are the right ones  
@@ -187,9 +192,18 @@ def main(session):
     label_time_course = mne.extract_label_time_course(stcs, labels_parc, src, mode='mean_flip')
     np.save(f'/media/8.1/final_data/laurap/source_space/parcelled/{session}_parcelled', label_time_course)
 
+    # label positions (mean of the label vertices), used to find neighbouring labels in decoding/searchlight.py
+    centroids = np.array([label.pos.mean(axis = 0) for label in labels_parc])
+    np.save(f'/media/8.1/final_data/laurap/source_space/parcelled/label_centroids', centroids)
+
 if __name__ == '__main__':
     ap = argparse.ArgumentParser()
-    ap.add_argument('-s', '--session', required=True, help='session, e.g., visual_03')
+    ap.add_argument('-s', '--session', required=True, nargs='+', help='session, e.g., visual_03, or several')
+    ap.add_argument('-n', '--n_parallel', type=int, default=None, help='maximum number of sessions processed at the same time (by default all), the cores are split between them')
     args = vars(ap.parse_args())
-    main(args['session'])
+
+    sessions = args['session']
+    split = resources.plan(min(len(sessions), args['n_parallel'] or len(sessions)))
+    with executors.Executor('serial' if split.n_processes == 1 else 'process', split) as executor:
+        list(executor.map(main, sessions))
 
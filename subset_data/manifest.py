@@ -0,0 +1,109 @@
+"""
+Lightweight metadata manifest of the prepared data.
+
+The manifest is written next to the data by prep_data.py and holds per session and per bin
+trial counts, class counts and trigger histograms, together with binomial chance levels for
+common alpha levels. Bookkeeping such as chance levels can then be done without loading any
+of the trial tensors.
+"""
+
+import json
+import numpy as np
+from scipy.stats import binom
+
+manifest_path = '../subset_data/data/manifest.json'
+alphas = [0.05, 0.01, 0.001]
+
+
+def binomial_threshold(n, alpha = 0.001, p = 0.5):
+    """Accuracy that n trials must exceed to be above chance at the given alpha level."""
+    k = binom.ppf(1-alpha, n, p)
+    return k/n
+
+
+def _histogram(values):
+    keys, counts = np.unique(np.asarray(values), return_counts = True)
+    return {str(k): int(c) for k, c in zip(keys, counts)}
+
+
+def build_manifest(ybin, sesh_inds, triggers = None):
+    """Builds the manifest from the labels and session indices of each bin.
+
+    Parameters
+    ----------
+    ybin : list
+        Labels (0 = inanimate, 1 = animate) of each bin.
+    sesh_inds : list
+        Session index of each trial in each bin.
+    triggers : list, optional
+        Triggers of each trial in each bin, used for the trigger histograms.
+
+    Returns
+    -------
+    manifest : dict
+    """
+    ybin = [np.asarray(y).astype(int) for y in ybin]
+    sesh_inds = [np.asarray(s).astype(int) for s in sesh_inds]
+    sessions = np.unique(np.concatenate(sesh_inds))
+    n_bins = len(ybin)
+
+    manifest = {'n_sessions': len(sessions), 'n_bins': n_bins, 'sessions': [], 'bins': []}
+
+    for b in range(n_bins):
+        entry = {'n_trials': len(ybin[b]), 'class_counts': _histogram(ybin[b]), 'session_counts': _histogram(sesh_inds[b])}
+        if triggers is not None:
+            entry['trigger_counts'] = _histogram(triggers[b])
+        manifest['bins'].append(entry)
+
+    for s in sessions:
+        y = np.concatenate([ybin[b][sesh_inds[b] == s] for b in range(n_bins)])
+        entry = {'n_trials': len(y), 'class_counts': _histogram(y), 'bin_counts': [int(np.sum(sesh_inds[b] == s)) for b in range(n_bins)]}
+        if triggers is not None:
+            entry['trigger_counts'] = _histogram(np.concatenate([np.asarray(triggers[b])[sesh_inds[b] == s] for b in range(n_bins)]))
+        entry['chance_level'] = {str(alpha): binomial_threshold(len(y), alpha) for alpha in alphas}
+        manifest['sessions'].append(entry)
+
+    return manifest
+
+
+def write_manifest(manifest, path = manifest_path):
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent = 4)
+
+
+def manifest_from_data(data_dir = '../subset_data/data'):
+    """Builds the manifest from the saved labels and session indices (no trial tensors are loaded).
+
+    Used for data prepared before the manifest was written by prep_data.py. Trigger histograms are
+    only available if triggerbin.npy exists.
+    """
+    ybin = np.load(f'{data_dir}/ybin.npy', allow_pickle=True)
+    sesh_inds = np.load(f'{data_dir}/seshinds_bins.npy', allow_pickle=True)
+    try:
+        triggers = np.load(f'{data_dir}/triggerbin.npy', allow_pickle=True)
+    except FileNotFoundError:
+        triggers = None
+
+    return build_manifest(list(ybin), list(sesh_inds), None if triggers is None else list(triggers))
+
+
+def load_manifest(path = manifest_path):
+    """Loads the manifest, creating it from the saved labels if it does not exist yet."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        manifest = manifest_from_data(path.rsplit('/', 1)[0])
+        write_manifest(manifest, path)
+        return manifest
+
+
+def chance_levels(manifest, alpha = 0.001):
+    """Binomial chance level of each session, precomputed for the alpha levels in `alphas`."""
+    chance = []
+    for session in manifest['sessions']:
+        if str(alpha) in session['chance_level']:
+            chance.append(session['chance_level'][str(alpha)])
+        else:
+            chance.append(binomial_threshold(session['n_trials'], alpha))
+    return chance
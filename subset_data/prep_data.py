@@ -2,9 +2,15 @@
 This script is used to prepare the data for the decoding and ERF analyses.
 """
 
+import sys
+sys.path.append('../decoding')
 import numpy as np
 import mne
 import json
+import profiling
+from manifest import build_manifest, write_manifest
+
+profile = None # e.g. './profiles/prep_data.jsonl' records the time and memory of each stage (see decoding/profiling.py)
 
 def balance_class_weights(X, y):
     keys, counts = np.unique(y, return_counts = True)
@@ -76,16 +82,17 @@ def read_and_concate_sessions(session_files, trigger_list):
             y_tmp = np.array(y_tmp)[idx]
             # before we concatenate, the correlation of each label is checked
             # if the correlation is negative, the sign is flipped
-            for k in range(X_tmp.shape[2]):
-                # take means over trials
-                mean1 = np.mean(X[:, :, k], axis = 1)
-                mean2 = np.mean(X_tmp[:, :, k], axis = 1)
-
-                # take correlation
-                corr = np.corrcoef(mean1, mean2)[0, 1]
-                if corr < 0:
-                    X_tmp[:, :, k] = X_tmp[:, :, k] * -1
-                    print(f'Flipped sign of label {k} in session {i} because correlation was negative')
+            with profiling.stage('sign_flip', file = i):
+                for k in range(X_tmp.shape[2]):
+                    # take means over trials
+                    mean1 = np.mean(X[:, :, k], axis = 1)
+                    mean2 = np.mean(X_tmp[:, :, k], axis = 1)
+
+                    # take correlation
+                    corr = np.corrcoef(mean1, mean2)[0, 1]
+                    if corr < 0:
+                        X_tmp[:, :, k] = X_tmp[:, :, k] * -1
+                        print(f'Flipped sign of label {k} in session {i} because correlation was negative')
                     
             X = np.concatenate((X, X_tmp), axis = 1)
             y = np.concatenate((y, y_tmp), axis = 0)
@@ -98,6 +105,7 @@ def create_blocks(sessions, n_bins, n, animate_triggers):
         X = sessions[i][0]
         y = sessions[i][1]
         X_sens = sessions[i][2]
+        triggers = np.array(y)
 
         y = [1 if i in animate_triggers else 0 for i in y]
 
@@ -111,6 +119,7 @@ def create_blocks(sessions, n_bins, n, animate_triggers):
             X_block = X[:, min:max, :]
             y_block = y[min:max]
             X_block_sens =  X_sens[:, min:max, :]
+            trig_block = triggers[min:max]
             session_inds.extend([i]*len(y_block))
 
         else:    
@@ -121,18 +130,23 @@ def create_blocks(sessions, n_bins, n, animate_triggers):
             X_block = np.concatenate((X_block, X_block_tmp), axis = 1)
             y_block = np.concatenate((y_block, y_block_tmp))
             X_block_sens =  np.concatenate((X_block_sens, X_block_sens_tmp), axis = 1)
+            trig_block = np.concatenate((trig_block, triggers[min:max]))
         
     X_block, y_block, remove_ind = balance_class_weights(X_block, y_block)
     X_block_sens = np.delete(X_block_sens, remove_ind, axis = 1)
+    trig_block = np.delete(trig_block, remove_ind, axis = 0)
     
     if remove_ind != []:
         session_inds = np.delete(np.array(session_inds), np.array(remove_ind), axis = 0)
 
-    return X_block, X_block_sens, y_block, session_inds
+    return X_block, X_block_sens, y_block, session_inds, trig_block
 
 
 
 def main():
+    if profile:
+        profiling.start(profile)
+
     with open('../event_ids.txt', 'r') as f:
         file = f.read()
         event_ids = json.loads(file)
@@ -145,7 +159,10 @@ def main():
     trig = [key for key, value in event_ids.items() if value in triggers]
 
     sessions = [['visual_03', 'visual_04'], ['visual_05', 'visual_06', 'visual_07'], ['visual_08', 'visual_09', 'visual_10'], ['visual_11', 'visual_12', 'visual_13'],['visual_14', 'visual_15', 'visual_16', 'visual_17', 'visual_18', 'visual_19'],['visual_23', 'visual_24', 'visual_25', 'visual_26', 'visual_27', 'visual_28', 'visual_29'],['visual_30', 'visual_31', 'visual_32', 'visual_33', 'visual_34', 'visual_35', 'visual_36', 'visual_37', 'visual_38']]
-    sessions_data = [read_and_concate_sessions(i, triggers) for i in sessions]
+    sessions_data = []
+    for s, session_files in enumerate(sessions):
+        with profiling.stage('load', session = s):
+            sessions_data.append(read_and_concate_sessions(session_files, triggers))
 
     # sign flipping for each session
     for i in range(len(sessions_data)):
@@ -153,16 +170,17 @@ def main():
             X = sessions_data[i][0]
             y = sessions_data[i][1]
 
-            for k in range(X.shape[2]):
-                # take means over trials
-                mean1 = np.mean(sessions_data[0][0][:, :, k], axis = 1)
-                mean2 = np.mean(X[:, :, k], axis = 1)
-
-                # take correlation
-                corr = np.corrcoef(mean1, mean2)[0, 1]
-                if corr < 0:
-                    X[:, :, k] = X[:, :, k] * -1
-                    print(f'Flipped sign of label {k} in session {i} because correlation was negative')
+            with profiling.stage('sign_flip', session = i):
+                for k in range(X.shape[2]):
+                    # take means over trials
+                    mean1 = np.mean(sessions_data[0][0][:, :, k], axis = 1)
+                    mean2 = np.mean(X[:, :, k], axis = 1)
+
+                    # take correlation
+                    corr = np.corrcoef(mean1, mean2)[0, 1]
+                    if corr < 0:
+                        X[:, :, k] = X[:, :, k] * -1
+                        print(f'Flipped sign of label {k} in session {i} because correlation was negative')
             sessions_data[i] = (X, y, sessions_data[i][2])
     
 
@@ -178,19 +196,29 @@ def main():
         session = (X, y, X_sens)
 
    
-    Xbin, Xsens, ybin, sesh_inds = [], [], [], []
+    Xbin, Xsens, ybin, sesh_inds, trigbin = [], [], [], [], []
 
     for n in range(7):
-        x, x_sens, y, sesh_inds_temp = create_blocks(sessions_data, n_bins=7, n=n, animate_triggers = animate_triggers)
+        with profiling.stage('blocks', bin = n):
+            x, x_sens, y, sesh_inds_temp, trig = create_blocks(sessions_data, n_bins=7, n=n, animate_triggers = animate_triggers)
         Xbin.append(x)
         ybin.append(y)
         Xsens.append(x_sens)
         sesh_inds.append(sesh_inds_temp)
+        trigbin.append(trig)
+
+    with profiling.stage('save'):
+        np.savez(f'data/xbin.npz', Xbin[0],Xbin[1],Xbin[2],Xbin[3],Xbin[4],Xbin[5],Xbin[6], allow_pickle = True)
+        np.savez(f'data/xbin_sens.npz', Xsens[0],Xsens[1],Xsens[2],Xsens[3],Xsens[4],Xsens[5],Xsens[6], allow_pickle = True)
+        np.save(f'data/ybin.npy', np.array(ybin, dtype=object))
+        np.save(f'data/seshinds_bins.npy', np.array(sesh_inds, dtype=object))
+        np.save(f'data/triggerbin.npy', np.array(trigbin, dtype=object))
+
+        # trial counts, class counts, trigger histograms and chance levels
+        write_manifest(build_manifest(ybin, sesh_inds, trigbin), 'data/manifest.json')
 
-    np.savez(f'data/xbin.npz', Xbin[0],Xbin[1],Xbin[2],Xbin[3],Xbin[4],Xbin[5],Xbin[6], allow_pickle = True)
-    np.savez(f'data/xbin_sens.npz', Xsens[0],Xsens[1],Xsens[2],Xsens[3],Xsens[4],Xsens[5],Xsens[6], allow_pickle = True)
-    np.save(f'data/ybin.npy', np.array(ybin, dtype=object))
-    np.save(f'data/seshinds_bins.npy', np.array(sesh_inds, dtype=object))
+    if profiling.enabled():
+        profiling.report(profiling.trace_path())
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,24 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# the scripts import each other as top-level modules, as when they are run from their own directory
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ['subset_data', 'decoding']:
+    sys.path.insert(0, os.path.join(root, directory))
+
+
+@pytest.fixture
+def trials():
+    """Small synthetic dataset as returned by cv_splits.stack_bins: X (T, N, C), y, session and bin of each trial."""
+    rng = np.random.default_rng(0)
+    T, C, n_sessions, n_bins, n_per_bin = 6, 5, 2, 3, 16
+    N = n_sessions * n_bins * n_per_bin
+
+    y = np.tile(np.repeat([0, 1], n_per_bin // 2), n_sessions * n_bins)
+    session = np.repeat(np.arange(n_sessions), n_bins * n_per_bin)
+    bins = np.tile(np.repeat(np.arange(n_bins), n_per_bin), n_sessions)
+    X = rng.standard_normal((T, N, C)) + 0.8 * y[None, :, None] * rng.standard_normal(C)
+
+    return X, y, session, bins
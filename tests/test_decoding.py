@@ -0,0 +1,35 @@
+import numpy as np
+import decoding
+import decoder_animacy
+import resources
+from accuracy_store import save_accuracies, load_index
+
+
+def test_save_alpha_grid(trials, tmp_path):
+    X, y, session, bins = trials
+    alphas = [0.1, 1., 10.]
+    decoder = decoder_animacy.Decoder(classification = True, ncv = 3, alpha = alphas, scale = True, model_type = 'RidgeClassifier', get_tgm = True)
+
+    r = decoding.run_tasks(X, y, decoding.within_tasks(session, bins, ['lbo']), decoder, backend = 'serial')['lbo']
+    path = str(tmp_path / 'accuracies.npy')
+    save_accuracies(path, r['accuracies'], decoding.accuracy_dims(True, alphas), n_valid = r['n_valid'])
+
+    T = X.shape[0]
+    index = load_index(path)
+    assert index['dims'] == ['session', 'fold', 'alpha', 'train_time', 'test_time']
+    assert index['shape'] == [2, 3, len(alphas), T, T]
+    assert decoding.accuracy_dims(False, 0.1) == ['session', 'fold', 'time']
+
+
+def test_backends_give_identical_results(trials):
+    X, y, session, bins = trials
+    decoder = decoder_animacy.Decoder(classification = True, ncv = 3, alpha = 'cv', scale = True, get_tgm = False, alpha_grid = [0.1, 0.5, 0.9], ncv_inner = 3, pseudo_k = 2, n_resamples = 2)
+
+    results = {}
+    for backend in ['serial', 'process']:
+        tasks = decoding.within_tasks(session, bins, ['lbo'])
+        results[backend] = decoding.run_tasks(X, y, tasks, decoder, backend = backend, split = resources.Split(2, 1))['lbo']['accuracies']
+
+    np.testing.assert_array_equal(results['serial'], results['process'])
+    # the tasks draw different pseudo-trials
+    assert not np.array_equal(results['serial'][0, 0], results['serial'][0, 1])
@@ -0,0 +1,34 @@
+import numpy as np
+from sklearn.covariance import ledoit_wolf
+from sklearn.discriminant_analysis import LinearDiscriminantAnalysis as LDA
+from sklearn.preprocessing import StandardScaler
+from sklearn.pipeline import make_pipeline
+from linear_models import ledoit_wolf_shrinkage, lda_fit
+
+
+def test_ledoit_wolf_shrinkage(trials):
+    X = trials[0]
+    expected = [ledoit_wolf(X[t])[1] for t in range(len(X))]
+
+    np.testing.assert_allclose(ledoit_wolf_shrinkage(X), expected, rtol = 1e-10)
+
+
+def test_lda_auto_shrinkage(trials):
+    X, y = trials[0], trials[1]
+    classes = np.unique(y)
+    coef, intercept, fitted_classes, shrinkage = lda_fit(X, y, 'auto', return_shrinkage = True)
+
+    # sklearn shrinks the covariance of every class, standardised on its own, with its own intensity
+    expected = [[ledoit_wolf(StandardScaler().fit_transform(X[t, y == c]))[1] for c in classes] for t in range(len(X))]
+    np.testing.assert_allclose(shrinkage, expected, rtol = 1e-10)
+
+    for t in range(len(X)):
+        model = make_pipeline(StandardScaler(), LDA(solver = 'lsqr', shrinkage = 'auto')).fit(X[t], y)
+        np.testing.assert_allclose(X[t] @ coef[t, :, 0] + intercept[t, 0], model.decision_function(X[t]), atol = 1e-8)
+
+
+def test_lda_fixed_shrinkage_returned(trials):
+    X, y = trials[0], trials[1]
+    *_, shrinkage = lda_fit(X, y, 0.3, return_shrinkage = True)
+
+    np.testing.assert_array_equal(shrinkage, np.full(len(X), 0.3))
@@ -0,0 +1,25 @@
+import numpy as np
+import decoder_animacy
+from linear_models import lda_fit
+from streaming import StreamingDecoder
+
+
+def test_bundle_of_scaled_data(trials, tmp_path):
+    X, y = trials[0], trials[1]
+    X_tesla = X * 1e-13
+    labels = np.where(y == 1, 7, 3)
+
+    # fitted on float32 data in fT, applied to epochs in T
+    decoder = decoder_animacy.Decoder(classification = True, ncv = 3, alpha = 0.1, scale = True, solver = 'batched', dtype = np.float32, keep_models = True)
+    X_femto = np.multiply(X_tesla, 1e15, dtype = np.float32)
+    decoder.train_test_decoding(X_femto, labels, X_femto, labels)
+    path = str(tmp_path / 'bundle.npy')
+    decoder.save_bundle(path, unit_scale = 1e15)
+
+    streaming = StreamingDecoder(path, max_batch = X.shape[1])
+    assert streaming.coef.dtype == np.float32
+    pred = streaming.predict(X_tesla.transpose(1, 2, 0))
+
+    coef, intercept, classes = lda_fit(X_femto.astype(np.float64), labels, 0.1)
+    expected = classes[(np.matmul(X_femto, coef)[..., 0] + intercept > 0).astype(int)]
+    np.testing.assert_array_equal(pred, expected)